@@ -0,0 +1,276 @@
+###############################
+#   Created for BFBC2 Mod Loader
+###############################
+
+"""
+Usage:
+    python manifest.py -m package.mft -b bundleManifest [-o output_folder] [-k cache_folder] [-s] mod_folder ...
+
+Builds package.mft and bundleManifest for the enabled mods in one pass.
+
+Both originals are parsed once into indexed structures (bundle source ->
+targets, target -> source, bundle path -> GUID/flag) and cached next to
+cache_folder, keyed on path, size and modification time. Every mod folder may
+contain a package.mft and/or a bundleManifest fragment in the same formats;
+they are applied in the given load order, so later mods win. Conflicts between
+mods are reported, and with -s nothing is written when there are any. Output
+files are written atomically.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import pickle
+import sys
+from getopt import getopt
+from typing import NamedTuple
+
+MFTFILE = "package.mft"
+BUNDLEMANIFESTFILE = "bundleManifest"
+
+
+class Conflict(NamedTuple):
+    file: str       # package.mft or bundleManifest
+    key: str        # bundle target or bundle path
+    first: str      # mod that set it first
+    second: str     # mod that overrides it
+    detail: str
+
+
+class PackageManifest:
+    """
+    package.mft: a few header lines (Signature, Authorative), then blocks of
+    one 'BundleSource' line followed by its 'BundleTarget' lines. The mapping
+    is many-to-many: the shipped manifests list the same target under many
+    sources (e.g. package:mods/level-00.fbrb).
+    """
+
+    def __init__(self, header: list = None, targets: dict = None):
+        self.header = header or []
+        self.targets = targets or {}   # source -> list of targets, in file order
+        self._target_index = None
+
+    @property
+    def target_index(self) -> dict:
+        """target -> set of sources, built on first use."""
+        if self._target_index is None:
+            index = {}
+            for source, targets in self.targets.items():
+                for t in targets:
+                    index.setdefault(t, set()).add(source)
+            self._target_index = index
+        return self._target_index
+
+    def __getstate__(self):
+        return self.header, self.targets
+
+    def __setstate__(self, state):
+        self.header, self.targets = state
+        self._target_index = None
+
+
+class BundleManifest:
+    """bundleManifest: one 'path<TAB>GUID<TAB>flag' line per bundle."""
+
+    def __init__(self, entries: dict = None):
+        self.entries = entries or {}   # path -> (guid, flag), in file order
+
+
+def parse_mft(text: str) -> PackageManifest:
+    mft = PackageManifest()
+    current = None
+    for number, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("BundleSource "):
+            current = mft.targets.setdefault(line[13:].strip(), [])
+        elif line.startswith("BundleTarget "):
+            if current is None:
+                raise ValueError("line %d: BundleTarget before the first BundleSource" % number)
+            current.append(line[13:].strip())
+        elif current is None:
+            mft.header.append(line)
+        else:
+            raise ValueError("line %d: unexpected %r" % (number, line))
+    return mft
+
+
+def parse_bundle_manifest(text: str) -> BundleManifest:
+    bm = BundleManifest()
+    for number, line in enumerate(text.splitlines(), 1):
+        # the shipped server manifest uses spaces instead of tabs
+        fields = line.split()
+        if not fields:
+            continue
+        if len(fields) != 3:
+            raise ValueError("line %d: expected path, GUID and flag, got %r" % (number, line))
+        bm.entries[fields[0]] = (fields[1], fields[2])
+    return bm
+
+
+def format_mft(mft: PackageManifest) -> str:
+    lines = list(mft.header) + [""]
+    for source, targets in mft.targets.items():
+        lines.append("BundleSource " + source)
+        lines.extend("BundleTarget " + t for t in targets)
+        lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def format_bundle_manifest(bm: BundleManifest) -> str:
+    return "".join("%s\t%s\t%s\n" % (path, guid, flag) for path, (guid, flag) in bm.entries.items())
+
+
+_loaded = {}   # (path, size, mtime) -> parsed manifest, for callers that merge more than once
+
+
+def load_cached(path: str, parser, cachedir: str = ""):
+    """Parses path with parser, reusing an in-process or pickled result while the file is unchanged."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    if key in _loaded:
+        return _loaded[key]
+
+    cachefile = ""
+    if cachedir:
+        name = hashlib.sha1(key[0].encode("utf-8")).hexdigest() + ".pickle"
+        cachefile = os.path.join(cachedir, name)
+        try:
+            with open(cachefile, "rb") as f:
+                cached_key, parsed = pickle.load(f)
+            if cached_key == key:
+                _loaded[key] = parsed
+                return parsed
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            pass
+
+    with open(path, "r", encoding="utf-8") as f:
+        parsed = parser(f.read())
+
+    if cachefile:
+        os.makedirs(cachedir, exist_ok=True)
+        write_atomic(cachefile, pickle.dumps((key, parsed), pickle.HIGHEST_PROTOCOL))
+    _loaded[key] = parsed
+    return parsed
+
+
+def load_overlay(folder: str, cachedir: str = "") -> tuple:
+    """Returns (PackageManifest or None, BundleManifest or None) found in a mod folder."""
+    mftpath = os.path.join(folder, MFTFILE)
+    bmpath = os.path.join(folder, BUNDLEMANIFESTFILE)
+    mft = load_cached(mftpath, parse_mft, cachedir) if os.path.isfile(mftpath) else None
+    bm = load_cached(bmpath, parse_bundle_manifest, cachedir) if os.path.isfile(bmpath) else None
+    return mft, bm
+
+
+def merge(mft: PackageManifest, bm: BundleManifest, overlays) -> tuple:
+    """
+    Applies overlays, a list of (mod name, PackageManifest or None, BundleManifest or None)
+    in load order, to the originals in a single pass. The originals are not modified;
+    target lists are only copied for bundle sources a mod touches.
+
+    Overlays only add (source, target) pairs, they never move a target away
+    from another source. The targets a mod lists for a source come first, in
+    its order, followed by the targets the source already had, so later mods
+    take priority. New sources are placed after the source the mod lists
+    before them. A conflict is reported when two different mods give
+    different targets for the same source, or a different GUID/flag for the
+    same bundle path.
+    Returns (PackageManifest, BundleManifest, list of Conflict).
+    """
+    targets = dict(mft.targets)
+    order = list(mft.targets)   # sources in output order
+    source_owner = {}           # source -> (mod, targets it listed)
+    entries = dict(bm.entries)
+    entry_owner = {}            # bundle path -> mod
+    conflicts = []
+
+    for mod, omft, obm in overlays:
+        if omft is not None:
+            anchor = None
+            for source, otargets in omft.targets.items():
+                if source not in targets:
+                    order.insert(order.index(anchor) + 1 if anchor is not None else 0, source)
+                    targets[source] = []
+                anchor = source
+
+                owner = source_owner.get(source)
+                if owner is not None and owner[0] != mod and owner[1] != otargets:
+                    conflicts.append(Conflict(MFTFILE, source, owner[0], mod,
+                                              "%s -> %s" % (", ".join(owner[1]), ", ".join(otargets))))
+                source_owner[source] = (mod, otargets)
+
+                listed = set(otargets)
+                targets[source] = list(otargets) + [t for t in targets[source] if t not in listed]
+
+        if obm is not None:
+            for path, value in obm.entries.items():
+                if path in entry_owner and entry_owner[path] != mod and entries[path] != value:
+                    conflicts.append(Conflict(BUNDLEMANIFESTFILE, path, entry_owner[path], mod,
+                                              "%s -> %s" % ("\t".join(entries[path]), "\t".join(value))))
+                entries[path] = value
+                entry_owner[path] = mod
+
+    return PackageManifest(list(mft.header), {s: targets[s] for s in order}), BundleManifest(entries), conflicts
+
+
+def write_atomic(path: str, data):
+    """Writes next to the target first so the game never sees a half written manifest."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def build(mftpath: str, bmpath: str, modfolders, outputfolder: str, cachedir: str = "", strict: bool = False) -> list:
+    """Merges the overlays of modfolders into the originals and writes both manifests to outputfolder."""
+    mft = load_cached(mftpath, parse_mft, cachedir)
+    bm = load_cached(bmpath, parse_bundle_manifest, cachedir)
+    overlays = [(os.path.basename(os.path.normpath(folder)),) + load_overlay(folder, cachedir) for folder in modfolders]
+
+    newmft, newbm, conflicts = merge(mft, bm, overlays)
+    if conflicts and strict:
+        return conflicts
+
+    os.makedirs(outputfolder, exist_ok=True)
+    write_atomic(os.path.join(outputfolder, MFTFILE), format_mft(newmft))
+    write_atomic(os.path.join(outputfolder, BUNDLEMANIFESTFILE), format_bundle_manifest(newbm))
+    return conflicts
+
+
+def main():
+    mftpath = bmpath = cachedir = ""
+    outputfolder = "."
+    strict = False
+
+    opts, args = getopt(sys.argv[1:], 'm:b:o:k:s')
+    for k, v in opts:
+        if k == '-m':
+            mftpath = v
+        elif k == '-b':
+            bmpath = v
+        elif k == '-o':
+            outputfolder = v
+        elif k == '-k':
+            cachedir = v
+        elif k == '-s':
+            strict = True
+
+    if not mftpath or not bmpath:
+        print("usage: python manifest.py -m package.mft -b bundleManifest [-o output] [-k cache] [-s] mod_folder ...")
+        sys.exit(2)
+
+    conflicts = build(mftpath, bmpath, args, outputfolder, cachedir, strict)
+    for c in conflicts:
+        print("Conflict in %s: %s set by %s and %s (%s)" % (c.file, c.key, c.first, c.second, c.detail))
+    if conflicts and strict:
+        print("Nothing written.")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,461 @@
+###############################
+#   Converted to Python 3.11  #
+#   Based on the BFBC2 RCON example client (server.pyw)
+###############################
+
+"""
+Asyncio RCON client for BFBC2 servers.
+
+The packet encoding below is the one of server.pyw, ported to bytes. On top of
+it there is an asyncio client and poll_servers(), which queries serverInfo on
+many servers at once with a per-server timeout, a bounded number of open
+connections and a TTL cache of the results.
+
+RconClient receives straight into a PacketBuffer and decodes words from
+memoryview slices of it, so nothing is copied before a word becomes a str.
+Several requests can be in flight on one connection; responses are matched by
+sequence number and server events go to subscriptions instead of blocking them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import time
+from struct import pack, unpack_from
+
+DEFAULT_TIMEOUT = 3.0      # seconds per server (connect + login + serverInfo)
+DEFAULT_CONCURRENCY = 32   # connections open at the same time
+DEFAULT_TTL = 30.0         # seconds a serverInfo result stays valid
+BUFFSIZE = 65536           # initial receive buffer per connection
+MAXPACKETSIZE = 16 * 1024 * 1024   # anything bigger is a broken stream, not a packet
+
+# region words ending a serverInfo response (server.pyw stopped reading there)
+REGIONS = ("EU", "OC", "AC", "Afr", "NAm", "SAm", "Asia")
+
+################################
+# DO NOT CHANGE ANYTHING HERE! #
+################################
+
+
+def EncodeHeader(isFromServer: bool, isResponse: bool, sequence: int) -> bytes:
+    header = sequence & 0x3fffffff
+    if isFromServer:
+        header += 0x80000000
+    if isResponse:
+        header += 0x40000000
+    return pack('<I', header)
+
+
+def DecodeHeader(data) -> list:
+    [header] = unpack_from('<I', data, 0)
+    return [header & 0x80000000, header & 0x40000000, header & 0x3fffffff]
+
+
+def EncodeInt32(size: int) -> bytes:
+    return pack('<I', size)
+
+
+def DecodeInt32(data) -> int:
+    return unpack_from('<I', data, 0)[0]
+
+
+def EncodeWords(words) -> tuple:
+    size = 0
+    encodedWords = bytearray()
+    for word in words:
+        bWord = str(word).encode("utf-8")
+        encodedWords += EncodeInt32(len(bWord))
+        encodedWords += bWord
+        encodedWords += b'\x00'
+        size += len(bWord) + 5
+
+    return size, bytes(encodedWords)
+
+
+def DecodeWords(size: int, data) -> list:
+    # data may be a memoryview; words are decoded from it without a bytes copy
+    words = []
+    offset = 0
+    while offset < size:
+        [wordLen] = unpack_from('<I', data, offset)
+        words.append(str(data[offset + 4:offset + 4 + wordLen], "utf-8", "replace"))
+        offset += wordLen + 5
+
+    return words
+
+
+def EncodePacket(isFromServer: bool, isResponse: bool, sequence: int, words) -> bytes:
+    encodedHeader = EncodeHeader(isFromServer, isResponse, sequence)
+    encodedNumWords = EncodeInt32(len(words))
+    [wordsSize, encodedWords] = EncodeWords(words)
+    encodedSize = EncodeInt32(wordsSize + 12)
+    return encodedHeader + encodedSize + encodedNumWords + encodedWords
+
+# Decode a request or response packet
+# Return format is:
+# [isFromServer, isResponse, sequence, words]
+
+
+def DecodePacket(data) -> list:
+    [isFromServer, isResponse, sequence] = DecodeHeader(data)
+    [wordsSize] = unpack_from('<I', data, 4)
+    wordsSize -= 12
+    words = DecodeWords(wordsSize, data[12:])
+    return [isFromServer, isResponse, sequence, words]
+
+
+def generatePasswordHash(salt: bytes, password: str) -> bytes:
+    m = hashlib.md5()
+    m.update(salt)
+    m.update(password.encode("utf-8"))
+    return m.digest()
+
+###############################################################################
+
+
+class RconError(Exception):
+    """Raised when a server answers a request with something other than OK."""
+
+
+class PacketBuffer:
+    """
+    Receive buffer for one connection. The socket writes straight into the free
+    tail (get_buffer/updated); complete packets are decoded from memoryview
+    slices and consumed bytes are only reclaimed by moving the unread tail to
+    the front once the buffer runs full, so a burst of packets costs linear time.
+    """
+
+    def __init__(self, size: int = BUFFSIZE):
+        self.data = bytearray(size)
+        self.start = 0   # first unread byte
+        self.end = 0     # first free byte
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def get_buffer(self, sizehint: int = -1) -> memoryview:
+        need = max(sizehint, 4096)
+        if len(self.data) - self.end < need:
+            unread = self.end - self.start
+            if len(self.data) - unread < need:
+                # grow into a new bytearray; views handed out earlier stay valid
+                data = bytearray(max(len(self.data) * 2, unread + need))
+                data[:unread] = self.data[self.start:self.end]
+                self.data = data
+            elif unread:
+                self.data[:unread] = self.data[self.start:self.end]
+            self.start, self.end = 0, unread
+        return memoryview(self.data)[self.end:]
+
+    def updated(self, nbytes: int):
+        self.end += nbytes
+
+    def feed(self, data):
+        self.get_buffer(len(data))[:len(data)] = data
+        self.updated(len(data))
+
+    def packets(self) -> list:
+        """Decodes and consumes all complete packets, see DecodePacket for the format."""
+        out = []
+        with memoryview(self.data) as view:
+            while self.end - self.start >= 8:
+                [size] = unpack_from('<I', view, self.start + 4)
+                if size < 12 or size > MAXPACKETSIZE:
+                    raise ValueError("invalid packet size %d" % size)
+                if self.end - self.start < size:
+                    break
+                out.append(DecodePacket(view[self.start:self.start + size]))
+                self.start += size
+        if self.start == self.end:
+            self.start = self.end = 0
+        return out
+
+
+class Subscription:
+    """
+    Server events for one subscriber, iterate with 'async for words in sub'.
+    The queue is bounded; when a subscriber falls behind the oldest events are
+    dropped so responses to requests are never held up by it.
+    """
+
+    def __init__(self, client: RconClient, events, maxsize: int):
+        self.client = client
+        self.events = frozenset(events)
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+        self.closed = False
+
+    def wants(self, words) -> bool:
+        return not self.events or (bool(words) and words[0] in self.events)
+
+    def push(self, words):
+        if self.closed:
+            return
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(words)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            if self.queue.full():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+            self.client.unsubscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> list:
+        words = await self.queue.get()
+        if words is None:
+            raise StopAsyncIteration
+        return words
+
+
+class RconClient(asyncio.BufferedProtocol):
+    """
+    One RCON connection. request() may be awaited from several tasks at once;
+    each response is matched to its request by sequence number.
+    """
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.transport = None
+        self.buffer = PacketBuffer()
+        self.sequence = 0
+        self.pending = {}          # sequence -> future of the response words
+        self.subscriptions = []
+        self.closed = None
+        self.writable = asyncio.Event()
+        self.writable.set()
+
+    # asyncio protocol callbacks
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.buffer.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes: int):
+        self.buffer.updated(nbytes)
+        try:
+            packets = self.buffer.packets()
+        except ValueError as e:
+            self.transport.abort()
+            self.fail(RconError(str(e)))
+            return
+        for packet in packets:
+            self.dispatch(packet)
+
+    def pause_writing(self):
+        self.writable.clear()
+
+    def resume_writing(self):
+        self.writable.set()
+
+    def connection_lost(self, exc):
+        self.writable.set()
+        self.fail(exc or ConnectionResetError("connection closed by server"))
+
+    # packet handling
+
+    def dispatch(self, packet: list):
+        [isFromServer, isResponse, sequence, words] = packet
+        if isResponse and not isFromServer:
+            future = self.pending.pop(sequence, None)
+            if future is not None and not future.done():
+                future.set_result(words)
+        elif isFromServer and not isResponse:
+            # server event: acknowledge it like the reference client does, then fan out
+            self.transport.write(EncodePacket(True, True, sequence, ["OK"]))
+            for subscription in self.subscriptions:
+                if subscription.wants(words):
+                    subscription.push(words)
+
+    def fail(self, exc: Exception):
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(exc)
+        self.pending.clear()
+        for subscription in list(self.subscriptions):
+            subscription.close()
+        if self.closed is not None and not self.closed.done():
+            self.closed.set_result(None)
+
+    # public api
+
+    async def connect(self):
+        loop = asyncio.get_running_loop()
+        self.closed = loop.create_future()
+        await loop.create_connection(lambda: self, self.host, self.port)
+
+    async def close(self):
+        if self.transport is None:
+            return
+        if not self.transport.is_closing():
+            self.transport.close()
+        await self.closed
+
+    def send_request(self, words) -> asyncio.Future:
+        """Sends a request without waiting; the returned future resolves to the response words."""
+        if self.transport is None or self.transport.is_closing():
+            raise ConnectionResetError("not connected")
+        sequence = self.sequence
+        self.sequence = (self.sequence + 1) & 0x3fffffff
+        future = asyncio.get_running_loop().create_future()
+        self.pending[sequence] = future
+        self.transport.write(EncodePacket(False, False, sequence, words))
+        return future
+
+    async def request(self, words) -> list:
+        """Sends a request and returns the words of its response."""
+        await self.writable.wait()
+        return await self.send_request(words)
+
+    async def login(self, password: str):
+        words = await self.request(["login.hashed"])
+        if len(words) < 2 or words[0] != "OK":
+            raise RconError("login.hashed not supported")
+
+        passwordHash = generatePasswordHash(bytes.fromhex(words[1]), password)
+        words = await self.request(["login.hashed", passwordHash.hex().upper()])
+        if not words or words[0] != "OK":
+            raise RconError(" ".join(words) or "login failed")
+
+    async def enable_events(self):
+        words = await self.request(["admin.eventsEnabled", "true"])
+        if not words or words[0] != "OK":
+            raise RconError(" ".join(words) or "admin.eventsEnabled failed")
+
+    def subscribe(self, events=(), maxsize: int = 1000) -> Subscription:
+        """Returns a subscription to server events, e.g. subscribe(["player.onChat"]); no names means all."""
+        subscription = Subscription(self, events, maxsize)
+        self.subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription in self.subscriptions:
+            self.subscriptions.remove(subscription)
+        subscription.close()
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+def parse_server_info(words) -> dict:
+    """Turns a serverInfo response into a dict; unknown trailing words are kept in 'extra'."""
+    def number(index: int):
+        try:
+            return int(words[index])
+        except (IndexError, ValueError):
+            return None
+
+    def word(index: int) -> str:
+        return words[index] if index < len(words) else ""
+
+    info = dict(
+        name=word(1), players=number(2), maxPlayers=number(3), mode=word(4), map=word(5),
+        roundsPlayed=number(6), roundsTotal=number(7), region="", extra=words[8:]
+    )
+    for w in reversed(words[8:]):
+        if w in REGIONS:
+            info["region"] = w
+            break
+    return info
+
+
+class TTLCache:
+    """Maps keys to values that expire ttl seconds after they were stored."""
+
+    def __init__(self, ttl: float = DEFAULT_TTL, entries: dict = None):
+        self.ttl = ttl
+        self.entries = dict(entries or {})   # key -> [timestamp, value]
+
+    def get(self, key: str, now: float = None):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if (now if now is not None else time.time()) - entry[0] > self.ttl:
+            del self.entries[key]
+            return None
+        return entry[1]
+
+    def put(self, key: str, value, now: float = None):
+        self.entries[key] = [now if now is not None else time.time(), value]
+
+    def prune(self, now: float = None):
+        now = now if now is not None else time.time()
+        self.entries = {k: e for k, e in self.entries.items() if now - e[0] <= self.ttl}
+
+
+async def query_server_info(host: str, port: int, password: str = "") -> list:
+    async with RconClient(host, port) as client:
+        if password:
+            await client.login(password)
+        return await client.request(["serverInfo"])
+
+
+async def poll_server(server: dict, semaphore: asyncio.Semaphore, timeout: float, cache: TTLCache) -> dict:
+    result = {k: v for k, v in server.items() if k != "password"}
+    result.update(status="ok", cached=False, latency_ms=None, info=None, error="")
+    try:
+        host, port = str(server["host"]), int(server["port"])
+        if not 1 <= port <= 65535:
+            raise ValueError("port %d is out of range" % port)
+    except (KeyError, TypeError, ValueError) as e:
+        result.update(status="error", error="invalid server entry: %s" % (str(e) or type(e).__name__))
+        return result
+    result["port"] = port
+
+    key = "%s:%d" % (host, port)
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        result.update(cached=True, info=cached)
+        return result
+
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            words = await asyncio.wait_for(query_server_info(host, port, server.get("password", "")), timeout)
+        except asyncio.TimeoutError:
+            result.update(status="timeout", error="no answer within %.1f s" % timeout)
+            return result
+        except (OSError, OverflowError, RconError, IndexError, KeyError, ValueError) as e:
+            result.update(status="error", error=str(e) or type(e).__name__)
+            return result
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    if not words or words[0] != "OK":
+        result.update(status="error", error=" ".join(words))
+        return result
+
+    result["info"] = parse_server_info(words)
+    if cache is not None:
+        cache.put(key, result["info"])
+    return result
+
+
+async def poll_servers(servers, timeout: float = DEFAULT_TIMEOUT, concurrency: int = DEFAULT_CONCURRENCY,
+                       cache: TTLCache = None) -> dict:
+    """
+    Queries serverInfo on all servers concurrently.
+    servers is a list of dicts with at least 'host' and 'port'; any other keys are passed through.
+    Returns one JSON-serialisable document with a result per server, in input order.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    start = time.perf_counter()
+    results = await asyncio.gather(*(poll_server(s, semaphore, timeout, cache) for s in servers))
+    return dict(
+        generated=time.time(),
+        duration_ms=round((time.perf_counter() - start) * 1000, 1),
+        servers=results
+    )
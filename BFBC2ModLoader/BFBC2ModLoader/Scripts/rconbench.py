@@ -0,0 +1,198 @@
+###############################
+#   Created for BFBC2 Mod Loader
+#   Uses rcon.py and rconmock.py from this folder
+###############################
+
+"""
+Usage:
+    python rconbench.py [-s servers] [-c connections] [-r requests] [-d depth] [-p password]
+                        [-l latency_ms] [-j jitter_ms] [-f fragment_bytes] [-e events_per_s] [-i] [-o result.json]
+
+Load test for rcon.py without a live game server. Starts rconmock.py with the
+given number of servers in a child process (or in this process with -i), opens
+c connections to every server, logs in, optionally enables events, and sends r
+serverInfo requests per connection with up to d of them in flight.
+
+Reports request throughput, p50/p99/max latency, received events and the
+memory the client side allocated (tracemalloc peak, plus max RSS where the
+platform has it).
+"""
+
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from getopt import getopt
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rcon  # noqa: E402
+import rconmock  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+
+def percentile(values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+def start_mock_process(servers: int, settings: dict):
+    """Runs rconmock.py in a child process so it does not share cpu time or memory with the client."""
+    args = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "rconmock.py"), "-n", str(servers)]
+    if settings.get("password"):
+        args += ["-p", settings["password"]]
+    args += ["-l", str(settings.get("latency", 0) * 1000), "-j", str(settings.get("jitter", 0) * 1000),
+             "-f", str(settings.get("fragment", 0)), "-e", str(settings.get("event_rate", 0))]
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, text=True)
+    ports = json.loads(process.stdout.readline())["ports"]
+    return process, ports
+
+
+async def run_connection(port: int, requests: int, depth: int, password: str, events: bool,
+                         latencies: list, stats: dict):
+    client = rcon.RconClient("127.0.0.1", port)
+    try:
+        await client.connect()
+        if password:
+            await client.login(password)
+
+        counter = None
+        if events:
+            subscription = client.subscribe(["player.onChat"])
+            await client.enable_events()
+
+            async def count_events():
+                async for _ in subscription:
+                    stats["events"] += 1
+            counter = asyncio.ensure_future(count_events())
+
+        remaining = [requests]
+
+        async def worker():
+            while remaining[0] > 0:
+                remaining[0] -= 1
+                start = time.perf_counter()
+                words = await client.request(["serverInfo"])
+                latencies.append(time.perf_counter() - start)
+                if not words or words[0] != "OK":
+                    stats["errors"] += 1
+
+        await asyncio.gather(*(worker() for _ in range(max(1, depth))))
+
+        if counter is not None:
+            stats["dropped"] += subscription.dropped
+            subscription.close()
+            await counter
+    except (OSError, rcon.RconError) as e:
+        stats["errors"] += 1
+        stats["failures"].append(str(e))
+    finally:
+        await client.close()
+
+
+async def bench(servers: int, connections: int, requests: int, depth: int, inprocess: bool, settings: dict) -> dict:
+    process = None
+    mocks = []
+    if inprocess:
+        mocks = await rconmock.start_servers(servers, **settings)
+        ports = [s.port for s in mocks]
+    else:
+        process, ports = start_mock_process(servers, settings)
+
+    latencies = []
+    stats = dict(errors=0, events=0, dropped=0, failures=[])
+    events = settings.get("event_rate", 0) > 0
+    password = settings.get("password", "")
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        await asyncio.gather(*(run_connection(port, requests, depth, password, events, latencies, stats)
+                               for port in ports for _ in range(connections)))
+    finally:
+        duration = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        for s in mocks:
+            await s.close()
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    latencies.sort()
+    result = dict(
+        servers=servers, connections=servers * connections, requests=len(latencies), depth=depth,
+        errors=stats["errors"], failures=stats["failures"][:10], events=stats["events"], dropped=stats["dropped"],
+        duration_s=round(duration, 3),
+        requests_per_s=round(len(latencies) / duration, 1) if duration > 0 else 0.0,
+        p50_ms=round(percentile(latencies, 50) * 1000, 3),
+        p99_ms=round(percentile(latencies, 99) * 1000, 3),
+        max_ms=round((latencies[-1] if latencies else 0.0) * 1000, 3),
+        tracemalloc_peak_mb=round(peak / 1_000_000, 2),
+    )
+    if resource is not None:
+        # kilobytes on linux, bytes on macos
+        scale = 1 if sys.platform == "darwin" else 1024
+        result["max_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1_000_000, 2)
+    return result
+
+
+def main():
+    servers, connections, requests, depth = 100, 2, 100, 8
+    inprocess = False
+    outputfile = ""
+    settings = {}
+
+    opts, args = getopt(sys.argv[1:], 's:c:r:d:p:l:j:f:e:io:')
+    for k, v in opts:
+        if k == '-s':
+            servers = int(v)
+        elif k == '-c':
+            connections = int(v)
+        elif k == '-r':
+            requests = int(v)
+        elif k == '-d':
+            depth = int(v)
+        elif k == '-p':
+            settings["password"] = v
+        elif k == '-l':
+            settings["latency"] = float(v) / 1000
+        elif k == '-j':
+            settings["jitter"] = float(v) / 1000
+        elif k == '-f':
+            settings["fragment"] = int(v)
+        elif k == '-e':
+            settings["event_rate"] = float(v)
+        elif k == '-i':
+            inprocess = True
+        elif k == '-o':
+            outputfile = v
+
+    result = asyncio.run(bench(servers, connections, requests, depth, inprocess, settings))
+
+    print("%d servers, %d connections, %d requests (depth %d), %d errors"
+          % (result["servers"], result["connections"], result["requests"], result["depth"], result["errors"]))
+    print("%.1f requests/s in %.2f s" % (result["requests_per_s"], result["duration_s"]))
+    print("latency p50 %.3f ms, p99 %.3f ms, max %.3f ms" % (result["p50_ms"], result["p99_ms"], result["max_ms"]))
+    print("events %d received, %d dropped" % (result["events"], result["dropped"]))
+    print("memory: tracemalloc peak %.2f MB%s" % (
+        result["tracemalloc_peak_mb"], ", max rss %.2f MB" % result["max_rss_mb"] if "max_rss_mb" in result else ""))
+
+    if outputfile:
+        with open(outputfile, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+###############################
+#   Created for BFBC2 Mod Loader
+#   Uses rcon.py from this folder
+###############################
+
+"""
+Usage:
+    python rconmock.py [-n servers] [-p password] [-l latency_ms] [-j jitter_ms] [-f fragment_bytes] [-e events_per_s]
+
+Local stand-in for BFBC2 game servers, speaking the same RCON packet format
+(EncodePacket/DecodePacket, the login.hashed salt/MD5 handshake, serverInfo
+and server-initiated events). It starts n servers on free ports of 127.0.0.1,
+prints {"ports": [...]} as one JSON line and serves until it is killed.
+
+Responses are delayed by latency +- jitter (so they may arrive out of order),
+written in pieces of fragment bytes, and connections that enabled events get
+player.onChat events at the given rate.
+"""
+
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from getopt import getopt
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rcon  # noqa: E402
+
+
+class MockServer:
+    """One fake BFBC2 server; all connections share its settings."""
+
+    def __init__(self, name: str = "Mock Server", password: str = "", latency: float = 0.0, jitter: float = 0.0,
+                 fragment: int = 0, event_rate: float = 0.0, players: int = 0, max_players: int = 32):
+        self.name = name
+        self.password = password
+        self.latency = latency           # seconds before a response is sent
+        self.jitter = jitter             # +- seconds added to latency per response
+        self.fragment = fragment         # bytes per write, 0 = whole packets
+        self.event_rate = event_rate     # events per second per connection with events enabled
+        self.players = players
+        self.max_players = max_players
+        self.started = time.time()
+        self.server = None
+        self.port = 0
+        self.connections = 0
+        self.requests = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        self.server = await asyncio.start_server(self.handle, host, port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def server_info(self) -> list:
+        uptime = str(int(time.time() - self.started))
+        return ["OK", self.name, str(self.players), str(self.max_players), "CONQUEST", "levels/mp_001",
+                "0", "2", "2", "250", "250", "0", "", "true", "true", "false", uptime, uptime,
+                "BC2", "", "", "", "", "EU"]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        connection = MockConnection(self, writer)
+        try:
+            await connection.run(reader)
+        finally:
+            self.connections -= 1
+
+
+class MockConnection:
+    def __init__(self, server: MockServer, writer: asyncio.StreamWriter):
+        self.server = server
+        self.writer = writer
+        self.salt = os.urandom(16)
+        self.logged_in = not server.password
+        self.sequence = 0
+        self.outgoing = asyncio.Queue()
+        self.events_task = None
+
+    async def run(self, reader: asyncio.StreamReader):
+        buffer = rcon.PacketBuffer()
+        sender = asyncio.ensure_future(self.send_loop())
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                buffer.feed(data)
+                for [isFromServer, isResponse, sequence, words] in buffer.packets():
+                    if isResponse:
+                        continue   # acknowledgements of our events
+                    self.server.requests += 1
+                    if not self.respond(sequence, words):
+                        return
+        except (OSError, ValueError):
+            pass
+        finally:
+            if self.events_task is not None:
+                self.events_task.cancel()
+            sender.cancel()
+            self.writer.close()
+
+    def respond(self, sequence: int, words: list) -> bool:
+        """Queues the response to one request; returns False when the connection should end."""
+        command = words[0] if words else ""
+        keep_open = True
+
+        if command == "login.hashed" and len(words) == 1:
+            answer = ["OK", self.salt.hex().upper()]
+        elif command == "login.hashed":
+            expected = rcon.generatePasswordHash(self.salt, self.server.password).hex().upper()
+            self.logged_in = words[1].upper() == expected
+            answer = ["OK"] if self.logged_in else ["InvalidPasswordHash"]
+        elif command == "login.plainText":
+            self.logged_in = len(words) > 1 and words[1] == self.server.password
+            answer = ["OK"] if self.logged_in else ["InvalidPassword"]
+        elif command == "serverInfo":
+            answer = self.server.server_info()
+        elif command == "version":
+            answer = ["OK", "BFBC2", "571287"]
+        elif command in ("logout", "quit"):
+            answer = ["OK"]
+            keep_open = command == "logout"
+        elif command == "echo":
+            answer = ["OK"] + words[1:]
+        elif not self.logged_in:
+            answer = ["LogInRequired"]
+        elif command == "admin.eventsEnabled":
+            enable = len(words) > 1 and words[1] == "true"
+            if enable and self.events_task is None and self.server.event_rate > 0:
+                self.events_task = asyncio.ensure_future(self.events_loop())
+            elif not enable and self.events_task is not None:
+                self.events_task.cancel()
+                self.events_task = None
+            answer = ["OK"]
+        else:
+            answer = ["UnknownCommand"]
+
+        self.send(rcon.EncodePacket(False, True, sequence, answer))
+        return keep_open
+
+    def send(self, packet: bytes):
+        delay = self.server.latency
+        if self.server.jitter:
+            delay += random.uniform(-self.server.jitter, self.server.jitter)
+        if delay > 0:
+            asyncio.get_running_loop().call_later(delay, self.outgoing.put_nowait, packet)
+        else:
+            self.outgoing.put_nowait(packet)
+
+    async def send_loop(self):
+        fragment = self.server.fragment
+        while True:
+            packet = await self.outgoing.get()
+            if fragment <= 0:
+                self.writer.write(packet)
+            else:
+                for start in range(0, len(packet), fragment):
+                    self.writer.write(packet[start:start + fragment])
+                    await self.writer.drain()
+            await self.writer.drain()
+
+    async def events_loop(self):
+        while True:
+            await asyncio.sleep(random.expovariate(self.server.event_rate))
+            self.sequence = (self.sequence + 1) & 0x3fffffff
+            self.outgoing.put_nowait(rcon.EncodePacket(True, False, self.sequence,
+                                                       ["player.onChat", "Player%d" % random.randint(1, 32), "gg"]))
+
+
+async def start_servers(count: int, host: str = "127.0.0.1", **settings) -> list:
+    """Starts count MockServer on free ports; settings are passed to every MockServer."""
+    servers = [MockServer(name="Mock Server %d" % (i + 1), **settings) for i in range(count)]
+    await asyncio.gather(*(s.start(host) for s in servers))
+    return servers
+
+
+async def serve(count: int, **settings):
+    servers = await start_servers(count, **settings)
+    print(json.dumps(dict(ports=[s.port for s in servers])), flush=True)
+    await asyncio.Event().wait()
+
+
+def main():
+    count = 1
+    settings = {}
+
+    opts, args = getopt(sys.argv[1:], 'n:p:l:j:f:e:')
+    for k, v in opts:
+        if k == '-n':
+            count = int(v)
+        elif k == '-p':
+            settings["password"] = v
+        elif k == '-l':
+            settings["latency"] = float(v) / 1000
+        elif k == '-j':
+            settings["jitter"] = float(v) / 1000
+        elif k == '-f':
+            settings["fragment"] = int(v)
+        elif k == '-e':
+            settings["event_rate"] = float(v)
+
+    try:
+        asyncio.run(serve(count, **settings))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+###############################
+#   Created for BFBC2 Mod Loader
+#   Uses rcon.py from this folder
+###############################
+
+"""
+Usage:
+    pythonw serverbrowser.pyw [-c servers.config] [-o serverInfo.json] [-t timeout] [-n connections] [-l ttl]
+
+Polls serverInfo on every server of servers.config at the same time and writes
+all results into one JSON document, so a full refresh of the server browser
+takes one timeout instead of one per server. Successful results are cached in
+serverInfoCache.json next to the output for ttl seconds.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+from getopt import getopt
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import rcon  # noqa: E402
+
+SERVERSCONFIG = os.path.join("BFBC2ModLoader", "Config", "servers.config")
+OUTPUTFILE = "serverInfo.json"
+CACHEFILE = "serverInfoCache.json"
+
+
+def load_servers(path: str) -> list:
+    """
+    Reads the <server Backend IP Port Req /> entries of servers.config. Port is
+    passed on as written; rcon.poll_server() reports a bad one for its entry.
+    """
+    servers = []
+    for node in ET.parse(path).getroot().iter("server"):
+        if not node.get("IP") or not node.get("Port"):
+            continue
+        servers.append(dict(
+            host=node.get("IP"), port=node.get("Port"),
+            backend=node.get("Backend", ""), req=node.get("Req", "").strip()
+        ))
+    return servers
+
+
+def load_cache(path: str, ttl: float) -> rcon.TTLCache:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        entries = {}
+    cache = rcon.TTLCache(ttl, entries)
+    cache.prune()
+    return cache
+
+
+def write_json(path: str, document):
+    """Writes next to the target first so readers never see a half written file."""
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(document, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def main():
+    configfile = SERVERSCONFIG
+    outputfile = OUTPUTFILE
+    timeout = rcon.DEFAULT_TIMEOUT
+    concurrency = rcon.DEFAULT_CONCURRENCY
+    ttl = rcon.DEFAULT_TTL
+
+    opts, args = getopt(sys.argv[1:], 'c:o:t:n:l:')
+    for k, v in opts:
+        if k == '-c':
+            configfile = v
+        elif k == '-o':
+            outputfile = v
+        elif k == '-t':
+            timeout = float(v)
+        elif k == '-n':
+            concurrency = int(v)
+        elif k == '-l':
+            ttl = float(v)
+
+    cachefile = os.path.join(os.path.dirname(os.path.abspath(outputfile)), CACHEFILE)
+    cache = load_cache(cachefile, ttl) if ttl > 0 else None
+
+    document = asyncio.run(rcon.poll_servers(load_servers(configfile), timeout, concurrency, cache))
+
+    write_json(outputfile, document)
+    if cache is not None:
+        write_json(cachefile, cache.entries)
+
+
+if __name__ == "__main__":
+    main()
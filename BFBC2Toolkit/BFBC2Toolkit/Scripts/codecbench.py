@@ -0,0 +1,177 @@
+###############################
+#   Created for BFBC2 Toolkit
+#   Uses fbrb.py from this folder
+###############################
+
+"""
+Usage:
+    python codecbench.py [-l level] [-a 0|1] [-r repeats] [-o result.json] folder_FbRB ...
+
+Round-trip check and benchmark of the deflate backends fbrb.py can use
+(zlib-ng, ISA-L and the zlib of the standard library). Every installed backend
+packs each ' FbRB' folder, unpacks the archive again and compares the result
+file by file with the source files packer() takes (those with a known
+extension); a backend that fails the comparison is reported as broken. Pack and unpack times are the best of the repeats.
+
+Archives written by one backend are also unpacked with every other one, so a
+backend that writes streams only it can read is caught as well.
+"""
+
+from __future__ import annotations
+
+import filecmp
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from getopt import getopt
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fbrb  # noqa: E402
+
+
+def installed() -> list:
+    codecs = []
+    for name in fbrb.CODECS:
+        try:
+            codecs.append(fbrb.loadcodec(name))
+        except ImportError:
+            pass
+    return codecs
+
+
+def packed_files(folder: str) -> dict:
+    """{relative path: (path, size)} of the files below folder that packer() takes (extension in fbrb.dic)."""
+    found = {}
+    for dir0, fname, size in fbrb.scan(folder):
+        if os.path.splitext(fname)[1][1:].lower() in fbrb.dic:
+            path = os.path.join(dir0, fname)
+            found[os.path.relpath(path, folder)] = (path, size)
+    return found
+
+
+def same_tree(a: str, b: str) -> list:
+    """Relative paths that differ between the packed files of folders a and b (missing on either side included)."""
+    left, right = packed_files(a), packed_files(b)
+    differences = sorted(left.keys() ^ right.keys())
+    for rel in sorted(left.keys() & right.keys()):
+        if not filecmp.cmp(left[rel][0], right[rel][0], shallow=False):
+            differences.append(rel)
+    return differences
+
+
+def folder_size(folder: str) -> int:
+    return sum(size for path, size in packed_files(folder).values())
+
+
+def timed(function, repeats: int) -> float:
+    best = None
+    for _ in range(max(1, repeats)):
+        start = time.perf_counter()
+        function()
+        duration = time.perf_counter() - start
+        best = duration if best is None else min(best, duration)
+    return best
+
+
+def bench_folder(folder: str, codecs: list, level: int, adaptive: int, repeats: int, workdir: str) -> dict:
+    """{codec name: result} for one ' FbRB' folder."""
+    results = {}
+    size = folder_size(folder)
+    archives = {}
+    previous = fbrb.codec, fbrb.inflater
+
+    try:
+        for codec in codecs:
+            fbrb.codec = fbrb.inflater = codec
+            target = os.path.join(workdir, codec.name)
+            archive = target + ".fbrb"
+            unpacked = os.path.join(workdir, codec.name + " unpacked")
+
+            def unpack():
+                shutil.rmtree(unpacked, ignore_errors=True)
+                fbrb.unpacker(archive, unpacked + os.sep)
+
+            packtime = timed(lambda: fbrb.packer(folder, target, level, 0, adaptive), repeats)
+            unpacktime = timed(unpack, repeats)
+            archives[codec.name] = archive
+            results[codec.name] = dict(
+                size=size, archive_size=os.path.getsize(archive),
+                pack_s=round(packtime, 3), unpack_s=round(unpacktime, 3),
+                pack_mb_s=round(size / packtime / 1_000_000, 1) if packtime > 0 else 0.0,
+                unpack_mb_s=round(size / unpacktime / 1_000_000, 1) if unpacktime > 0 else 0.0,
+                differences=same_tree(folder, unpacked),
+            )
+            shutil.rmtree(unpacked, ignore_errors=True)
+
+        # every backend has to read what the others wrote
+        for codec in codecs:
+            fbrb.inflater = codec
+            for name, archive in archives.items():
+                if name == codec.name:
+                    continue
+                unpacked = os.path.join(workdir, "cross")
+                shutil.rmtree(unpacked, ignore_errors=True)
+                try:
+                    fbrb.unpacker(archive, unpacked + os.sep)
+                    differences = same_tree(folder, unpacked)
+                except codec.error as e:
+                    differences = [str(e)]
+                results[name].setdefault("read_by", {})[codec.name] = not differences
+                shutil.rmtree(unpacked, ignore_errors=True)
+    finally:
+        fbrb.codec, fbrb.inflater = previous
+    return results
+
+
+def main():
+    level = fbrb.compressionlevel
+    adaptive = fbrb.adaptivecompression
+    repeats = 1
+    outputfile = ""
+
+    opts, args = getopt(sys.argv[1:], 'l:a:r:o:')
+    for k, v in opts:
+        if k == '-l':
+            level = int(v)
+        elif k == '-a':
+            adaptive = int(v)
+        elif k == '-r':
+            repeats = int(v)
+        elif k == '-o':
+            outputfile = v
+
+    folders = [os.path.normpath(f) for f in args if os.path.isdir(f) and os.path.normpath(f).endswith(" FbRB")]
+    if not folders:
+        print(__doc__)
+        sys.exit(2)
+
+    codecs = installed()
+    print("backends: %s" % ", ".join(c.name for c in codecs))
+
+    report = {}
+    broken = False
+    with tempfile.TemporaryDirectory() as workdir:
+        for folder in folders:
+            results = bench_folder(folder, codecs, level, adaptive, repeats, workdir)
+            report[folder] = results
+            print(folder)
+            for name, r in results.items():
+                ok = not r["differences"] and all(r.get("read_by", {}).values())
+                broken = broken or not ok
+                print("  %-8s %s  %10d bytes  pack %7.1f MB/s  unpack %7.1f MB/s"
+                      % (name, "ok    " if ok else "BROKEN", r["archive_size"], r["pack_mb_s"], r["unpack_mb_s"]))
+
+    if outputfile:
+        with open(outputfile, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    if broken:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
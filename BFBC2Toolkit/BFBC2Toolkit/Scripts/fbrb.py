@@ -5,21 +5,40 @@
 ###############################
 
 import os
+import stat
 import sys
-import gzip
 import tempfile
-from struct import pack, unpack
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from struct import pack, unpack, unpack_from
 from io import BytesIO
 
 # packing parameters
-compressionlevel = 1     # 0–9 (0 = no compression)
+compressionlevel = 1     # 0–9 (0 = no compression); in adaptive mode it applies to every member
+                         # that is not stored, unless raiselevels lets 'levels' go above it
 packtmpfile = 1          # temporary file on disk for packing
-unpacktmpfile = 0        # temporary file for unpacking
+unpacktmpfile = 0        # unused, unpacker() streams the payload
+
+adaptivecompression = 1  # level per member and stored blocks for incompressible ones
+                         # (video, audio, ...) instead of burning cpu on them; still one gzip stream
+raiselevels = 0          # 1 = extensions with a higher level in 'levels' (dbx, ...) use it instead
+packreaders = 4          # threads reading files ahead of the compressor (0 = read in the main thread)
+packbudget = 64_000_000  # max bytes read ahead but not yet compressed
+packbatch = 1_000_000    # small files are read in groups of about this many bytes per task
+deflatecodec = "zlib"    # codec for packing: "zlib", "zlib-ng" or "isal"; empty = fastest one installed.
+                         # zlib-ng level 1 is faster but writes up to 25 % bigger archives than zlib level 1
+inflatecodec = ""        # codec for unpacking, same names; all give the same output, so empty = fastest
 
 unpackfolder = ""
 packfolder = ""
 BUFFSIZE = 1_000_000     # 1 MB buffer
 
+PROBESIZE = 32768        # bytes of a member test-compressed to decide whether to store it
+PROBERATIO = 0.97        # store a member if the probe does not get below this ratio
+WINDOWSIZE = 32768       # deflate window, carried over when the compressor is restarted
+CODECS = ("zlib-ng", "isal", "zlib")   # deflate implementations, fastest first
+
 # Dump buffer used by unpacker
 dump = None
 
@@ -63,34 +82,336 @@ dic = dict(
     dbmanifest='<non-resource>'
 )
 
+# compression level per extension (keys of dic) for adaptive compression;
+# 0 stores the member, extensions not listed are probed and use compressionlevel.
+# Other levels only count with raiselevels and never lower compressionlevel.
+levels = dict(
+    binkmemory=0, wave=0, impulseresponse=0,
+    dbx=6, dbmanifest=6, bin=6
+)
+
+
+class Codec:
+    """
+    One deflate implementation. zlib-ng and ISA-L ship modules with the same
+    api as zlib, so packer() and unpacker() only ever talk to this wrapper.
+    """
+
+    def __init__(self, name: str, module):
+        self.name = name
+        self.module = module
+        self.error = module.error
+
+    def level(self, level: int) -> int:
+        # ISA-L only knows levels 0-3
+        if self.name == "isal":
+            return min(3, (level + 2) // 3)
+        return level
+
+    def compressobj(self, level: int, wbits: int = -15, zdict: bytes = b""):
+        """Raw deflate by default; wbits 31 writes a gzip header and trailer."""
+        if zdict:
+            return self.module.compressobj(self.level(level), zlib.DEFLATED, wbits, 8, zlib.Z_DEFAULT_STRATEGY, zdict)
+        return self.module.compressobj(self.level(level), zlib.DEFLATED, wbits)
+
+    def decompressobj(self, wbits: int = 31):
+        return self.module.decompressobj(wbits)
+
+    def crc32(self, data, value: int = 0) -> int:
+        return self.module.crc32(data, value)
+
+    def gzip(self, data, level: int) -> bytes:
+        c = self.compressobj(level, 31)
+        return c.compress(data) + c.flush()
+
+    def gunzip(self, data) -> bytes:
+        d = self.decompressobj(31)
+        out = d.decompress(data)
+        if not d.eof:
+            raise self.error("gzip stream is truncated")
+        return out
+
+
+def loadcodec(name: str) -> Codec:
+    """Raises ImportError if the implementation is not installed."""
+    if name == "zlib-ng":
+        from zlib_ng import zlib_ng as module
+    elif name == "isal":
+        from isal import isal_zlib as module
+    elif name == "zlib":
+        module = zlib
+    else:
+        raise ValueError("unknown codec %r, use one of %s" % (name, ", ".join(CODECS)))
+    return Codec(name, module)
+
+
+def findcodec(name: str = "") -> Codec:
+    """The codec called name, or the fastest of CODECS that is installed if name is empty."""
+    if name:
+        return loadcodec(name)
+    for name in CODECS:
+        try:
+            return loadcodec(name)
+        except ImportError:
+            continue
+
+
+codec = findcodec(deflatecodec)      # packer()
+inflater = findcodec(inflatecodec)   # unpacker() and payloadchunks()
+
+
+def compressible(data) -> bool:
+    """Test-compresses a sample from the start and the middle of data."""
+    if len(data) <= 2 * PROBESIZE:
+        sample = data
+    else:
+        middle = len(data) // 2
+        sample = bytes(data[:PROBESIZE]) + bytes(data[middle:middle + PROBESIZE])
+    c = codec.compressobj(1)
+    return len(c.compress(sample)) + len(c.flush()) < len(sample) * PROBERATIO
+
+
+class GzipWriter:
+    """
+    Writes a single gzip stream from a raw deflate object of the codec (no
+    gzip.GzipFile in between). If no deflate object is running at the end
+    (nothing written, or a subclass ended on stored blocks) the stream ends
+    with an empty final stored block instead.
+    """
+
+    def __init__(self, fileobj, level: int):
+        self.fileobj = fileobj
+        self.level = level
+        self.crc = 0
+        self.size = 0
+        self.deflate = None
+        # magic, deflate, no flags, no mtime, no extra flags, unknown os
+        fileobj.write(b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff")
+
+    def account(self, data):
+        self.crc = codec.crc32(data, self.crc)
+        self.size += len(data)
+
+    def write(self, data, level: int = None):
+        if not data:
+            return
+        if self.deflate is None:
+            self.deflate = codec.compressobj(self.level)
+        self.fileobj.write(self.deflate.compress(data))
+        self.account(data)
+
+    def close(self):
+        if self.deflate is not None:
+            self.fileobj.write(self.deflate.flush())
+        else:
+            # empty final stored block
+            self.fileobj.write(b"\x01\x00\x00\xff\xff")
+        # crc32 and size of the uncompressed data
+        self.fileobj.write(pack("<II", self.crc & 0xffffffff, self.size & 0xffffffff))
+
+
+class AdaptiveGzipWriter(GzipWriter):
+    """
+    Members are deflated at their own level or written as stored blocks.
+    Consecutive members at the same level share one running compressor, so
+    runs of small members (dbx) compress exactly like a plain gzip stream.
+    Only when the level changes or stored blocks follow is the compressor
+    sync-flushed to a byte boundary; a new one then starts with the previous
+    32 KB as dictionary, so no matches are lost across the switch.
+    """
+
+    def __init__(self, fileobj, level: int):
+        super().__init__(fileobj, level)
+        self.deflatelevel = 0
+        self.recent = deque()   # tail of the uncompressed data, at least WINDOWSIZE bytes if there are
+        self.recentsize = 0
 
-def packer(sourcefolder: str, targetfile: str = "", compressionlevel_param: int = None, tmpfile: int = None):
+    def window(self) -> bytes:
+        return b"".join(self.recent)[-WINDOWSIZE:]
+
+    def remember(self, data):
+        if len(data) >= WINDOWSIZE:
+            self.recent.clear()
+            self.recent.append(bytes(data[-WINDOWSIZE:]))
+            self.recentsize = WINDOWSIZE
+            return
+        self.recent.append(data)
+        self.recentsize += len(data)
+        while self.recentsize - len(self.recent[0]) >= WINDOWSIZE:
+            self.recentsize -= len(self.recent.popleft())
+
+    def write(self, data, level: int = None):
+        """Appends one member; level None means probe and use the default level."""
+        if not data:
+            return
+        if level is None:
+            level = self.level if compressible(data) else 0
+
+        if level:
+            if self.deflate is None or level != self.deflatelevel:
+                if self.deflate is not None:
+                    self.fileobj.write(self.deflate.flush(zlib.Z_SYNC_FLUSH))
+                self.deflate = codec.compressobj(level, zdict=self.window())
+                self.deflatelevel = level
+            self.fileobj.write(self.deflate.compress(data))
+        else:
+            if self.deflate is not None:
+                self.fileobj.write(self.deflate.flush(zlib.Z_SYNC_FLUSH))
+                self.deflate = None
+            view = memoryview(data)
+            for start in range(0, len(view), 65535):
+                block = view[start:start + 65535]
+                # non-final stored block: header byte, LEN, NLEN, raw data
+                self.fileobj.write(b"\x00" + pack("<HH", len(block), len(block) ^ 0xffff))
+                self.fileobj.write(block)
+
+        self.account(data)
+        self.remember(data)
+
+
+def isjunction(e: os.DirEntry) -> bool:
+    """Windows junctions are no symlinks, but must not be followed either (they can form cycles)."""
+    if hasattr(e, "is_junction"):
+        return e.is_junction()
+    attributes = getattr(e.stat(follow_symlinks=False), "st_file_attributes", 0)
+    return bool(attributes & stat.FILE_ATTRIBUTE_REPARSE_POINT)
+
+
+def scan(sourcefolder: str) -> list:
+    """
+    Lists (dir0, fname, size) of every file below sourcefolder in os.walk order.
+    Sizes come from the directory listing (free on Windows) instead of a stat per file.
+    """
+    found = []
+    stack = [sourcefolder]
+    while stack:
+        folder = stack.pop()
+        subdirs = []
+        with os.scandir(folder) as it:
+            for e in it:
+                # like os.walk(), linked folders are neither descended into nor listed
+                if e.is_dir(follow_symlinks=False):
+                    if not isjunction(e):
+                        subdirs.append(e.path)
+                elif e.is_file():
+                    found.append((folder, e.name, e.stat().st_size))
+        stack.extend(reversed(subdirs))
+    return found
+
+
+def readfile(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def prefetch(items: list, reader=readfile, readers: int = None, budget: int = None, batch: int = None):
+    """
+    Yields reader(key) for every (key, size) in items, in order, while a thread
+    pool reads ahead as long as less than budget bytes are waiting. Consecutive
+    small files go to the pool in groups of about batch bytes, so thousands of
+    dbx files do not cost a future each.
+    """
+    if readers is None:
+        readers = packreaders
+    if budget is None:
+        budget = packbudget
+    if batch is None:
+        batch = packbatch
+
+    if readers <= 0:
+        for key, size in items:
+            yield reader(key)
+        return
+
+    groups = []   # (keys, bytes)
+    keys = []
+    total = 0
+    for key, size in items:
+        keys.append(key)
+        total += size
+        if total >= batch:
+            groups.append((keys, total))
+            keys = []
+            total = 0
+    if keys:
+        groups.append((keys, total))
+
+    def readgroup(keys: list) -> list:
+        return [reader(key) for key in keys]
+
+    with ThreadPoolExecutor(max_workers=readers) as pool:
+        pending = deque()
+        inflight = 0
+        i = 0
+        for _ in range(len(groups)):
+            # always keep one read going, even if it alone is bigger than the budget
+            while i < len(groups) and (not pending or inflight + groups[i][1] <= budget):
+                pending.append((pool.submit(readgroup, groups[i][0]), groups[i][1]))
+                inflight += groups[i][1]
+                i += 1
+            future, size = pending.popleft()
+            inflight -= size
+            yield from future.result()
+
+
+def packer(sourcefolder: str, targetfile: str = "", compressionlevel_param: int = None, tmpfile: int = None,
+           adaptive: int = None, readers: int = None, budget: int = None, store=None):
     """
     Pack a folder that ends with " FbRB" into a .fbrb archive.
     Logic kept as original; improved bytes handling.
+    With adaptive compression members that 'levels' marks with 0 are stored,
+    unlisted ones are probed, and the rest use the level of the archive (or the
+    higher one from 'levels' if raiselevels is set).
+    Files are scanned once, then read ahead on 'readers' threads (up to 'budget'
+    bytes) while the main thread compresses them in TOC order.
+    If store (a ProfileStore of fbrbstore.py) is given, sourcefolder is the name
+    of an archive in it and the members are read from the database instead.
     """
     global compressionlevel, packtmpfile
     if compressionlevel_param is None:
         compressionlevel_param = compressionlevel
     if tmpfile is None:
         tmpfile = packtmpfile
+    if adaptive is None:
+        adaptive = adaptivecompression
 
-    sourcefolder = lp(sourcefolder)
-    if not os.path.isdir(sourcefolder) or not sourcefolder.endswith(" FbRB"):
-        return
-
-    # Print like original (skip first 4 chars like original did)
-    try:
-        print(sourcefolder[4:])
-    except Exception:
+    # members: (folder relative to the archive root ending with "/", file name, key for reader, size)
+    if store is not None:
         print(sourcefolder)
+        if not targetfile:
+            targetfile = os.path.splitext(os.path.basename(sourcefolder))[0]
+        # the \\?\ prefix of lp() only works on absolute paths
+        targetfile = lp(os.path.abspath(targetfile)) + ".fbrb"
+
+        members = []
+        for member, path, size in store.scan(sourcefolder):
+            folder, fname = path.rsplit("/", 1) if "/" in path else ("", path)
+            members.append((folder + "/" if folder else "", fname, member, size))
+        reader = store.read_id
+        # sqlite connections belong to the thread that opened them
+        readers = 0
+    else:
+        sourcefolder = lp(sourcefolder)
+        if not os.path.isdir(sourcefolder) or not sourcefolder.endswith(" FbRB"):
+            return
 
-    toplevellength = len(sourcefolder) + 1  # for relative paths (original behavior)
+        # Print like original (skip first 4 chars like original did)
+        try:
+            print(sourcefolder[4:])
+        except Exception:
+            print(sourcefolder)
 
-    if not targetfile:
-        targetfile = sourcefolder[:-5] + ".fbrb"
-    else:
-        targetfile = lp(targetfile) + ".fbrb"
+        toplevellength = len(sourcefolder) + 1  # for relative paths (original behavior)
+
+        if not targetfile:
+            targetfile = sourcefolder[:-5] + ".fbrb"
+        else:
+            targetfile = lp(targetfile) + ".fbrb"
+
+        # scan folder once; keep original code's use of backslash terminated dir
+        members = [((dir0 + "\\").replace("\\", "/")[toplevellength:], fname, os.path.join(dir0, fname), size)
+                   for dir0, fname, size in scan(sourcefolder)]
+        reader = readfile
 
     # strings block (bytes), ext dictionary and entries block (bytes)
     strings_bytes = bytearray()
@@ -106,79 +427,79 @@ def packer(sourcefolder: str, targetfile: str = "", compressionlevel_param: int
         s2 = BytesIO()
 
     # If we compress payload, write into gzip wrapper around s2
-    if compressionlevel_param:
-        zippy2 = gzip.GzipFile(fileobj=s2, mode="wb", compresslevel=compressionlevel_param, filename="")
+    if compressionlevel_param and adaptive:
+        zippy2 = AdaptiveGzipWriter(s2, compressionlevel_param)
+    elif compressionlevel_param:
+        zippy2 = GzipWriter(s2, compressionlevel_param)
     else:
         zippy2 = None
 
-    # walk through folder
-    for dir0, dirs, files in os.walk(sourcefolder):
-        # keep original code's use of backslash terminated dir
-        dir_with_slash = dir0 + "\\"
-        for fname in files:
-            rawfilename, extension = os.path.splitext(fname)
-            extension = extension[1:].lower()
-            try:
-                ext = dic[extension]
-            except KeyError:
-                # skip unknown extensions (original behavior)
-                continue
+    # keep files with known extensions (original behavior)
+    known = []
+    for folder, fname, key, size in members:
+        rawfilename, extension = os.path.splitext(fname)
+        extension = extension[1:].lower()
+        if extension in dic:
+            known.append((folder, fname, rawfilename, extension, key, size))
 
-            numofentries += 1
+    contents = prefetch([(m[4], m[5]) for m in known], reader, readers, budget)
 
-            # restore filename strings to res, dbx, bin, dbmanifest; null terminated
-            if extension == "dbxdeleted":
-                filepath = dir_with_slash.replace("\\", "/")[toplevellength:] + fname[:-7] + "\x00"
-            elif extension not in ("dbx", "bin", "dbmanifest"):
-                filepath = dir_with_slash.replace("\\", "/")[toplevellength:] + rawfilename + ".res\x00"
-            else:
-                filepath = dir_with_slash.replace("\\", "/")[toplevellength:] + fname + "\x00"
+    for (folder, fname, rawfilename, extension, key, size), data in zip(known, contents):
+        ext = dic[extension]
 
-            # stringoffset is current length of strings_bytes (as 4-byte big-endian)
-            stringoffset_bytes = makeint(len(strings_bytes))
-            # append filepath as bytes
-            if isinstance(filepath, str):
-                filepath_b = filepath.encode("utf-8", errors="replace")
-            else:
-                filepath_b = bytes(filepath)
-            strings_bytes.extend(filepath_b)
-
-            # file length and deleteflag
-            fullpath = os.path.join(dir0, fname)
-            filelength = os.path.getsize(fullpath)
-            if filelength == 0:
-                deleteflag = b"\x00\x00\x00\x00"
-            else:
-                deleteflag = b"\x00\x01\x00\x00"
+        numofentries += 1
 
-            # check ext position (store ext strings into strings_bytes to avoid duplicates)
-            if ext in extdic:
-                extpos = extdic[ext]
-            else:
-                extpos = len(strings_bytes)
-                extdic[ext] = extpos
-                ext_b = (ext + "\x00").encode("utf-8", errors="replace")
-                strings_bytes.extend(ext_b)
-
-            # make the 24-byte entry: stringoffset(4) + deleteflag(4) + payloadoffset(4) + 2*filelength(4+4) + extpos(4)
-            # Note: original wrote 2*makeint(filelength) (two copies). We'll replicate exactly.
-            entries.extend(stringoffset_bytes)
-            entries.extend(deleteflag)
-            entries.extend(makeint(payloadoffset))
-            entries.extend(makeint(filelength))
-            entries.extend(makeint(filelength))  # duplicate as original
-            entries.extend(makeint(extpos))
-
-            payloadoffset += filelength
-
-            # read file content and write to payload (possibly compressed)
-            with open(fullpath, "rb") as f1:
-                data = f1.read()
-                if zippy2:
-                    zippy2.write(data)
-                else:
-                    # s2 is BytesIO or TemporaryFile
-                    s2.write(data)
+        # restore filename strings to res, dbx, bin, dbmanifest; null terminated
+        if extension == "dbxdeleted":
+            filepath = folder + fname[:-7] + "\x00"
+        elif extension not in ("dbx", "bin", "dbmanifest"):
+            filepath = folder + rawfilename + ".res\x00"
+        else:
+            filepath = folder + fname + "\x00"
+
+        # stringoffset is current length of strings_bytes (as 4-byte big-endian)
+        stringoffset_bytes = makeint(len(strings_bytes))
+        # append filepath as bytes
+        strings_bytes.extend(filepath.encode("utf-8", errors="replace"))
+
+        # file length (of what was actually read) and deleteflag
+        filelength = len(data)
+        if filelength == 0:
+            deleteflag = b"\x00\x00\x00\x00"
+        else:
+            deleteflag = b"\x00\x01\x00\x00"
+
+        # check ext position (store ext strings into strings_bytes to avoid duplicates)
+        if ext in extdic:
+            extpos = extdic[ext]
+        else:
+            extpos = len(strings_bytes)
+            extdic[ext] = extpos
+            ext_b = (ext + "\x00").encode("utf-8", errors="replace")
+            strings_bytes.extend(ext_b)
+
+        # make the 24-byte entry: stringoffset(4) + deleteflag(4) + payloadoffset(4) + 2*filelength(4+4) + extpos(4)
+        # Note: original wrote 2*makeint(filelength) (two copies). We'll replicate exactly.
+        entries.extend(stringoffset_bytes)
+        entries.extend(deleteflag)
+        entries.extend(makeint(payloadoffset))
+        entries.extend(makeint(filelength))
+        entries.extend(makeint(filelength))  # duplicate as original
+        entries.extend(makeint(extpos))
+
+        payloadoffset += filelength
+
+        # write file content to payload (possibly compressed)
+        if adaptive and zippy2:
+            level = levels.get(extension)
+            if level:
+                level = max(level, compressionlevel_param) if raiselevels else compressionlevel_param
+            zippy2.write(data, level)
+        elif zippy2:
+            zippy2.write(data)
+        else:
+            # s2 is BytesIO or TemporaryFile
+            s2.write(data)
 
     # finalize payload compression if used
     if zippy2:
@@ -199,11 +520,7 @@ def packer(sourcefolder: str, targetfile: str = "", compressionlevel_param: int
     part1.extend(makeint(payloadoffset))
 
     # compress part1 into gzip (original did that)
-    s1 = BytesIO()
-    with gzip.GzipFile(fileobj=s1, mode="wb", compresslevel=1) as gz:
-        gz.write(bytes(part1))
-    output = s1.getvalue()
-    s1.close()
+    output = codec.gzip(part1, 1)
 
     # write final file: header "FbRB" + len(output) + output + payload (from s2)
     with open(targetfile, "wb") as out:
@@ -230,14 +547,168 @@ def packer(sourcefolder: str, targetfile: str = "", compressionlevel_param: int
 # Часть 3/4 — unpacker(), lp(), main()
 # ---------------------------
 
+def member_name(fname: str, extension: str) -> str:
+    """Relative path (with /) of a member as unpacker() writes it."""
+    folder, filename = os.path.split(fname)
+    name, ending = os.path.splitext(filename)
+    extension = extension.lower()
+    if extension == "*deleted*":
+        ending = ".dbxdeleted" if ending == ".dbx" else ".resdeleted"
+    elif extension == "<non-resource>" and ending == ".res":
+        ending = ".nonres"
+    elif extension != "<non-resource>":
+        ending = "." + extension
+    return (folder + "/" if folder else "") + name + ending
+
+
+def tocstring(data: bytes, offset: int) -> str:
+    end = data.index(b"\x00", offset)
+    return data[offset:end].decode("utf-8", errors="replace")
+
+
+def read_toc(part1: bytes, errors: list) -> tuple:
+    """
+    Parses the decompressed part1 into (members, zipped, payloadlen), where
+    members is a list of (name, payloadoffset, payloadlen) with names from
+    member_name(). Problems are appended to errors; used by the tools that read
+    archives without unpacking them (fbrbverify, fbrbstore, fbrbpreview).
+    """
+    if len(part1) < 17 or part1[0:4] != b"\x00\x00\x00\x02":
+        errors.append("part1: bad header")
+        return [], False, 0
+
+    strlen = unpack_from(">I", part1, 4)[0]
+    if strlen + 12 > len(part1):
+        errors.append("part1: string table of %d bytes does not fit" % strlen)
+        return [], False, 0
+
+    numentries = unpack_from(">I", part1, strlen + 8)[0]
+    if strlen + 12 + numentries * 24 + 5 != len(part1):
+        errors.append("part1: %d entries do not match its size of %d bytes" % (numentries, len(part1)))
+        return [], False, 0
+
+    zipped = part1[-5] != 0
+    payloadlen = unpack_from(">I", part1, len(part1) - 4)[0]
+
+    members = []
+    for i in range(numentries):
+        (nameoffset, undeleteflag, offset, length, length2, extoffset) = unpack_from(">6I", part1, strlen + 12 + i * 24)
+        if nameoffset >= strlen or extoffset >= strlen:
+            errors.append("entry %d: string offset outside of the string table" % i)
+            continue
+        try:
+            name = member_name(tocstring(part1, nameoffset + 8), tocstring(part1, extoffset + 8))
+        except ValueError:
+            errors.append("entry %d: unterminated string" % i)
+            continue
+        if length != length2:
+            errors.append("%s: sizes %d and %d differ" % (name, length, length2))
+        if offset + length > payloadlen:
+            errors.append("%s: %d bytes at %d end behind the payload (%d bytes)" % (name, length, offset, payloadlen))
+        members.append((name, offset, length))
+
+    return members, zipped, payloadlen
+
+
+def payloadchunks(f, zipped: int = 1):
+    """
+    Yields the payload from f in chunks of at most BUFFSIZE bytes, inflated if
+    zipped. The gzip stream may consist of several members, which gzip readers
+    concatenate. Raises EOFError if the stream is cut off and inflater.error if
+    it is corrupt.
+    """
+    if not zipped:
+        while True:
+            chunk = f.read(BUFFSIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    d = None
+    raw = b""
+    done = False   # f has no more input
+    while True:
+        if not raw and not done:
+            raw = f.read(BUFFSIZE)
+            done = not raw
+        if d is None:
+            # gzip readers skip zero padding behind a member
+            raw = raw.lstrip(b"\x00")
+            if not raw:
+                if done:
+                    return
+                continue
+            d = inflater.decompressobj(31)
+        # at most BUFFSIZE out per call, the rest of the input waits in unconsumed_tail
+        chunk = d.decompress(raw, BUFFSIZE)
+        if chunk:
+            yield chunk
+        if d.eof:
+            raw = d.unused_data
+            d = None
+        else:
+            raw = d.unconsumed_tail
+            if done and not raw and not chunk:
+                raise EOFError("Compressed file ended before the end-of-stream marker was reached")
+
+
+class PayloadTruncated(EOFError):
+    """The payload ended before the members listed in missing (indexes into spans) did."""
+
+    def __init__(self, size: int, missing: list):
+        super().__init__("payload ends at %d before %d member(s) do" % (size, len(missing)))
+        self.size = size
+        self.missing = missing
+
+
+def memberslices(chunks, spans: list):
+    """
+    Cuts a stream of payload chunks into members. spans holds (offset, length, ...)
+    per member; yields (index, piece, first, last) in payload order, where
+    piece is a memoryview into the current chunk. A member that lies inside one
+    chunk comes as a single piece with first and last set. Members usually
+    follow each other, but the format allows them to overlap, so every member
+    covering the chunk gets its slice. Raises PayloadTruncated at the end if
+    some members were not complete.
+    """
+    order = sorted(range(len(spans)), key=lambda i: (spans[i][0], spans[i][0] + spans[i][1]))
+    active = []   # members started in an earlier chunk
+    nexti = 0
+    pos = 0
+    for chunk in chunks:
+        view = memoryview(chunk)
+        end = pos + len(view)
+        still = []
+        for i in active:
+            stop = spans[i][0] + spans[i][1]
+            yield i, view[:min(stop, end) - pos], False, stop <= end
+            if stop > end:
+                still.append(i)
+        active = still
+        while nexti < len(order) and spans[order[nexti]][0] < end:
+            i = order[nexti]
+            nexti += 1
+            start, stop = spans[i][0], spans[i][0] + spans[i][1]
+            yield i, view[start - pos:min(stop, end) - pos], True, stop <= end
+            if stop > end:
+                active.append(i)
+        pos = end
+
+    # empty members right at the end of the payload are complete as well
+    while nexti < len(order) and spans[order[nexti]][1] == 0 and spans[order[nexti]][0] <= pos:
+        yield order[nexti], memoryview(b""), True, True
+        nexti += 1
+    if active or nexti < len(order):
+        raise PayloadTruncated(pos, active + order[nexti:])
+
+
 def unpacker(sourcefilename: str, targetfolder: str = "", tmpfile: int = None):
     """
     Unpack a .fbrb archive into a folder ending with ' FbRB'.
-    Logic kept as original; bytes handling fixed for Python 3.
+    The payload is streamed through the inflater once, in offset order, so no
+    temporary copy of it is needed; tmpfile is only kept for old callers.
     """
     global dump
-    if tmpfile is None:
-        tmpfile = unpacktmpfile
 
     sourcefilename = lp(sourcefilename)
     if not sourcefilename.lower().endswith(".fbrb"):
@@ -258,94 +729,64 @@ def unpacker(sourcefilename: str, targetfolder: str = "", tmpfile: int = None):
             return
         cut = unpack(">I", cut_bytes)[0]
 
-        part1_bytes = f.read(cut)
-        # read remaining as part2 (either into temp file or BytesIO)
-        if tmpfile:
-            part2 = tempfile.TemporaryFile()
-            # read rest in chunks to avoid memory spike
-            while True:
-                chunk = f.read(BUFFSIZE)
-                if not chunk:
-                    break
-                part2.write(chunk)
-            part2.seek(0)
+        dump = inflater.gunzip(f.read(cut))
+
+        # determine zipped flag: original checked dump[-5] == "\x00"
+        # Now check byte value safely
+        if len(dump) >= 5 and dump[-5] == 0:
+            zipped = 0
         else:
-            part2_bytes = f.read()
-            part2 = BytesIO(part2_bytes)
+            zipped = 1
 
-    # decompress gzip parts
-    part1 = BytesIO(part1_bytes)
-    with gzip.GzipFile(mode="rb", fileobj=part1) as gz1:
-        dump = gz1.read()
-    part1.close()
+        # helper readint uses global 'dump'
+        strlen = readint(4)
+        numentries = readint(strlen + 8)
 
-    # open second gzip (payload) as fileobj
-    if tmpfile:
-        zippy2 = gzip.GzipFile(mode="rb", fileobj=part2)
-    else:
-        # part2 is BytesIO containing possibly compressed payload
-        zippy2 = gzip.GzipFile(mode="rb", fileobj=part2)
-
-    # determine zipped flag: original checked dump[-5] == "\x00"
-    # Now check byte value safely
-    if len(dump) >= 5 and dump[-5] == 0:
-        zipped = 0
-    else:
-        zipped = 1
+        members = []
+        for i in range(numentries):
+            filenameoffset = readint(strlen + 12 + i * 24)
+            # undeleteflag = readint(strlen+16+i*24)  # unused
+            payloadoffset = readint(strlen + 20 + i * 24)
+            payloadlen = readint(strlen + 24 + i * 24)
+            # payloadlen2 = readint(strlen+28+i*24)  # unused
+            extensionoffset = readint(strlen + 32 + i * 24)
 
-    # helper readint uses global 'dump'
-    strlen = readint(4)
-    numentries = readint(strlen + 8)
+            # get folder/name and extension
+            folder, filename = os.path.split(member_name(grabstring(filenameoffset + 8),
+                                                         grabstring(extensionoffset + 8)))
 
-    for i in range(numentries):
-        filenameoffset = readint(strlen + 12 + i * 24)
-        # undeleteflag = readint(strlen+16+i*24)  # unused
-        payloadoffset = readint(strlen + 20 + i * 24)
-        payloadlen = readint(strlen + 24 + i * 24)
-        # payloadlen2 = readint(strlen+28+i*24)  # unused
-        extensionoffset = readint(strlen + 32 + i * 24)
-
-        # get folder/name and extension
-        fname_full = grabstring(filenameoffset + 8)
-        folder, filename = os.path.split(fname_full)
-        name, ending = os.path.splitext(filename)
-        extension = grabstring(extensionoffset + 8).lower()
-
-        if extension == "*deleted*":
-            if ending == ".dbx":
-                ending = ".dbxdeleted"
-            else:
-                ending = ".resdeleted"
-        elif extension == "<non-resource>" and ending == ".res":
-            ending = ".nonres"
-        elif extension != "<non-resource>":
-            ending = "." + extension
-
-        finalpath = targetfolder if targetfolder else sourcefilename[:-5] + " FbRB\\"
-        finalpath = lp(finalpath)
-        finalpath = os.path.join(finalpath, folder.replace("/", "\\"))
-        if folder != "":
-            # ensure trailing slash isn't duplicated; os.path.join handles it
-            pass
+            finalpath = targetfolder if targetfolder else sourcefilename[:-5] + " FbRB\\"
+            finalpath = lp(finalpath)
+            finalpath = os.path.join(finalpath, folder.replace("/", "\\"))
 
-        if not os.path.isdir(finalpath):
-            os.makedirs(finalpath, exist_ok=True)
+            if not os.path.isdir(finalpath):
+                os.makedirs(finalpath, exist_ok=True)
 
-        outpath = os.path.join(finalpath, name + ending)
-        # write payload from second gzip/file
-        with open(outpath, "wb") as out:
-            if zipped:
-                # payload is in the gzip stream zippy2
-                zippy2.seek(payloadoffset)
-                out.write(zippy2.read(payloadlen))
-            else:
-                # payload is raw in part2
-                part2.seek(payloadoffset)
-                out.write(part2.read(payloadlen))
+            members.append((payloadoffset, payloadlen, os.path.join(finalpath, filename)))
 
-    zippy2.close()
-    if tmpfile:
-        part2.close()
+        # write payload from second gzip/file; a member inside one chunk is written
+        # at once, only members crossing a chunk boundary keep their file open
+        opened = {}   # index: file of a member that continues in the next chunk
+        try:
+            for i, piece, first, last in memberslices(payloadchunks(f, zipped), members):
+                if first and last:
+                    with open(members[i][2], "wb") as out:
+                        out.write(piece)
+                elif first:
+                    opened[i] = open(members[i][2], "wb")
+                    opened[i].write(piece)
+                else:
+                    opened[i].write(piece)
+                    if last:
+                        opened.pop(i).close()
+        except PayloadTruncated as e:
+            # members behind the end of the payload come out empty, like a short read did
+            for i in e.missing:
+                if i not in opened:
+                    open(members[i][2], "wb").close()
+        finally:
+            for out in opened.values():
+                out.close()
 
 
 def lp(path: str) -> str:
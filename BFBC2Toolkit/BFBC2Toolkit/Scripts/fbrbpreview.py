@@ -0,0 +1,582 @@
+###############################
+#   Created for BFBC2 Toolkit
+#   Uses fbrb.py and fbrbverify.py from this folder
+###############################
+
+"""
+Usage:
+    python fbrbpreview.py build [-s size] [-m max_mb] [-w workers] cache.db game_folder|archive.fbrb ...
+    python fbrbpreview.py get [-s size] cache.db archive.fbrb member output.png
+    python fbrbpreview.py list cache.db archive.fbrb
+    python fbrbpreview.py evict [-m max_mb] cache.db
+
+Preview cache for .itexture and .terrainheightfield members. Members are read
+straight from the archive by their TOC offset (uncompressed archives are
+seeked, compressed ones are streamed once and only the wanted members are
+kept), nothing is extracted to disk. Textures are decoded from the header and
+the smallest mip level that is still at least 'size' pixels (DXT1/3/5,
+ARGB8888 and grayscale), heightfields from their 16 bit height samples; both
+are downscaled with NumPy and stored as PNG.
+
+Previews live in one SQLite database, keyed on the SHA-1 of the member, so a
+texture shared by many bundles is decoded once. Archive members map to those
+hashes as long as size and modification time of the archive are unchanged,
+which makes a lookup after the first build a single query. The least recently
+used previews are evicted when the cache grows beyond max_mb.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from getopt import getopt
+from struct import pack, unpack_from
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fbrb  # noqa: E402
+import fbrbverify  # noqa: E402
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+THUMBSIZE = 128                      # longer side of a preview in pixels
+CACHESIZE = 256_000_000              # bytes of previews kept before the least recently used are evicted
+WORKERS = os.cpu_count() or 1
+INFLIGHT = 4                         # members queued per worker while streaming an archive
+
+PREVIEWS = {"itexture": "texture", "terrainheightfield": "heightfield"}
+
+# itexture format -> (name, bytes per 4x4 block or per pixel, block compressed)
+FORMATS = {
+    0: ("DXT1", 8, True), 18: ("DXT1", 8, True),
+    1: ("DXT3", 16, True),
+    2: ("DXT5", 16, True), 13: ("DXT5", 16, True), 19: ("DXT5", 16, True), 20: ("DXT5", 16, True),
+    9: ("ARGB8888", 4, False),
+    10: ("Gray", 1, False),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    archive INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    path TEXT NOT NULL,
+    hash BLOB NOT NULL,
+    PRIMARY KEY (archive, path)
+);
+CREATE TABLE IF NOT EXISTS previews (
+    hash BLOB PRIMARY KEY,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    format TEXT NOT NULL,
+    png BLOB,
+    error TEXT,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS members_hash ON members(hash);
+CREATE INDEX IF NOT EXISTS previews_used ON previews(used);
+"""
+
+
+def preview_kind(member: str) -> str:
+    """'texture', 'heightfield' or '' for a member path as written by unpacker()."""
+    return PREVIEWS.get(os.path.splitext(member)[1][1:].lower(), "")
+
+
+# decoding
+
+def rgb565(values):
+    r = (values >> 11) & 31
+    g = (values >> 5) & 63
+    b = values & 31
+    return np.stack([(r * 255 + 15) // 31, (g * 255 + 31) // 63, (b * 255 + 15) // 31], axis=-1)
+
+
+def decode_blocks(data, width: int, height: int, name: str):
+    """Decodes DXT1/3/5 into an RGBA array of height x width."""
+    bw, bh = max(1, (width + 3) // 4), max(1, (height + 3) // 4)
+    blocksize = 8 if name == "DXT1" else 16
+    blocks = np.frombuffer(data, np.uint8, bw * bh * blocksize).reshape(bw * bh, blocksize)
+    n = len(blocks)
+
+    colors = np.ascontiguousarray(blocks[:, -8:])
+    c = colors[:, :4].copy().view("<u2").astype(np.int32)
+    c0, c1 = c[:, 0], c[:, 1]
+    p0, p1 = rgb565(c0), rgb565(c1)
+    # DXT1 blocks with c0 <= c1 have three colors and transparent black
+    four = (c0 > c1) if name == "DXT1" else np.ones(n, bool)
+    palette = np.empty((n, 4, 4), np.int32)
+    palette[:, 0, :3] = p0
+    palette[:, 1, :3] = p1
+    palette[:, 2, :3] = np.where(four[:, None], (2 * p0 + p1) // 3, (p0 + p1) // 2)
+    palette[:, 3, :3] = np.where(four[:, None], (p0 + 2 * p1) // 3, 0)
+    palette[:, :, 3] = 255
+    palette[:, 3, 3] = np.where(four, 255, 0)
+
+    bits = colors[:, 4:].copy().view("<u4")[:, 0]
+    index = (bits[:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 3
+    pixels = palette[np.arange(n)[:, None], index]
+
+    if name == "DXT3":
+        bits = np.ascontiguousarray(blocks[:, :8]).view("<u8")[:, 0]
+        pixels[:, :, 3] = ((bits[:, None] >> (4 * np.arange(16, dtype=np.uint64))) & np.uint64(15)) * 17
+    elif name == "DXT5":
+        a0, a1 = blocks[:, 0].astype(np.int32), blocks[:, 1].astype(np.int32)
+        eight = a0 > a1
+        alphas = np.empty((n, 8), np.int32)
+        alphas[:, 0], alphas[:, 1] = a0, a1
+        for i in range(1, 7):
+            alphas[:, i + 1] = np.where(eight, ((7 - i) * a0 + i * a1) // 7,
+                                        ((5 - i) * a0 + i * a1) // 5 if i < 5 else (0 if i == 5 else 255))
+        raw = np.zeros((n, 8), np.uint8)
+        raw[:, :6] = blocks[:, 2:8]
+        bits = raw.view("<u8")[:, 0]
+        index = (bits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & np.uint64(7)
+        pixels[:, :, 3] = alphas[np.arange(n)[:, None], index.astype(np.intp)]
+
+    image = pixels.reshape(bh, bw, 4, 4, 4).transpose(0, 2, 1, 3, 4).reshape(bh * 4, bw * 4, 4)
+    return image[:height, :width].astype(np.uint8)
+
+
+def texture_header(data) -> tuple:
+    """(format, width, height, mip count, header length) of an .itexture."""
+    # resource wrapped textures carry 64 bytes in front of the texture header
+    base = 64 if data[:3] == b"RES" else 0
+    if len(data) < base + 92:
+        raise ValueError("texture header is truncated")
+    fmt, = unpack_from("<I", data, base + 8)
+    width, height = unpack_from("<II", data, base + 16)
+    mips, = unpack_from("<I", data, base + 28)
+    return fmt, width, height, max(1, mips), base + 92
+
+
+def decode_texture(data, size: int) -> tuple:
+    """(RGBA or gray array, width, height, format name) of the mip level that fits size best."""
+    fmt, width, height, mips, offset = texture_header(data)
+    if fmt not in FORMATS:
+        raise ValueError("unsupported texture format %d" % fmt)
+    name, unit, compressed = FORMATS[fmt]
+
+    # mip levels are stored from the largest down; skip those bigger than needed
+    w, h = width, height
+    for level in range(mips):
+        if compressed:
+            length = max(1, (w + 3) // 4) * max(1, (h + 3) // 4) * unit
+        else:
+            length = w * h * unit
+        if level == mips - 1 or max(w // 2, h // 2) < size:
+            break
+        offset += length
+        w, h = max(1, w // 2), max(1, h // 2)
+
+    if offset + length > len(data):
+        raise ValueError("texture data is truncated")
+    mip = memoryview(data)[offset:offset + length]
+    if compressed:
+        image = decode_blocks(mip, w, h, name)
+    elif name == "ARGB8888":
+        # stored as B, G, R, A
+        image = np.frombuffer(mip, np.uint8).reshape(h, w, 4)[:, :, [2, 1, 0, 3]]
+    else:
+        image = np.frombuffer(mip, np.uint8).reshape(h, w)
+    return image, width, height, name
+
+
+def decode_heightfield(data) -> tuple:
+    """(uint16 array, width, height) of a .terrainheightfield."""
+    if len(data) < 49:
+        raise ValueError("heightfield header is truncated")
+    width, = unpack_from("<I", data, 24)
+    height, = unpack_from("<I", data, 37)
+    # console files lack 4 bytes of the pc header
+    offset = 49 if data[0] == 0 else 45
+    if offset + width * height * 2 > len(data):
+        raise ValueError("heightfield data is truncated")
+    return np.frombuffer(data, "<u2", width * height, offset).reshape(height, width), width, height
+
+
+def downscale(image, size: int):
+    """Box filter so that the longer side is at most size pixels."""
+    h, w = image.shape[:2]
+    factor = max(1, -(-max(h, w) // size))
+    if factor == 1:
+        return image
+    ph, pw = -(-h // factor) * factor, -(-w // factor) * factor
+    if (ph, pw) != (h, w):
+        image = np.pad(image, [(0, ph - h), (0, pw - w)] + [(0, 0)] * (image.ndim - 2), mode="edge")
+    shape = (ph // factor, factor, pw // factor, factor) + image.shape[2:]
+    return image.reshape(shape).mean(axis=(1, 3))
+
+
+def encode_png(image) -> bytes:
+    """8 bit grayscale or RGBA PNG of a uint8 array."""
+    h, w = image.shape[:2]
+    colortype = 0 if image.ndim == 2 else 6
+    rows = np.ascontiguousarray(image, np.uint8).reshape(h, -1)
+    raw = np.hstack([np.zeros((h, 1), np.uint8), rows]).tobytes()
+
+    def chunk(kind: bytes, body: bytes) -> bytes:
+        return pack(">I", len(body)) + kind + body + pack(">I", zlib.crc32(kind + body) & 0xffffffff)
+
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", pack(">IIBBBBB", w, h, 8, colortype, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 1)) + chunk(b"IEND", b""))
+
+
+def render(kind: str, data, size: int = THUMBSIZE) -> tuple:
+    """
+    (width, height, format, png or None, error or None) of one member.
+    Runs in the worker processes, so it only takes and returns plain values.
+    Raises ValueError for a kind preview_kind() does not return.
+    """
+    if kind not in PREVIEWS.values():
+        raise ValueError("no preview for members of kind %r" % kind)
+    if np is None:
+        return 0, 0, "", None, "numpy is not installed"
+    try:
+        if kind == "texture":
+            image, width, height, name = decode_texture(data, size)
+            image = downscale(image, size)
+        elif kind == "heightfield":
+            heights, width, height = decode_heightfield(data)
+            image = downscale(heights, size)
+            low, high = image.min(), image.max()
+            image = (image - low) * (255.0 / (high - low)) if high > low else np.zeros_like(image)
+            name = "Height16"
+        return width, height, name, encode_png(np.rint(image).astype(np.uint8)), None
+    except (ValueError, IndexError) as e:
+        return 0, 0, "", None, str(e)
+
+
+# reading
+
+def read_members(path: str, wanted) -> tuple:
+    """
+    Returns (TOC members as (name, offset, length), generator of (name, data)
+    for the names in wanted). Raises ValueError if the archive is broken.
+    """
+    size = os.path.getsize(path)
+    f = open(path, "rb")
+    try:
+        if size < 8 or f.read(4) != b"FbRB":
+            raise ValueError("%s: not an FbRB archive" % path)
+        cut = unpack_from(">I", f.read(4))[0]
+        if cut + 8 > size:
+            raise ValueError("%s: part1 size %d exceeds the file" % (path, cut))
+        try:
+            part1 = fbrb.inflater.gunzip(f.read(cut))
+        except fbrb.inflater.error as e:
+            raise ValueError("%s: part1: %s" % (path, e))
+        errors = []
+        members, zipped, payloadlen = fbrb.read_toc(part1, errors)
+        if errors:
+            raise ValueError("%s: %s" % (path, "; ".join(errors)))
+    except BaseException:
+        f.close()
+        raise
+
+    selected = [m for m in members if m[0] in wanted]
+    start = 8 + cut
+
+    def seek():
+        with f:
+            for name, offset, length in selected:
+                f.seek(start + offset)
+                data = f.read(length)
+                if len(data) != length:
+                    raise ValueError("%s: %s is truncated" % (path, name))
+                yield name, data
+
+    def stream():
+        data = {}   # index: bytes so far of a member that continues in the next chunk
+        left = len(selected)
+        with f:
+            try:
+                for i, piece, first, last in fbrb.memberslices(fbrb.payloadchunks(f), [m[1:] for m in selected]):
+                    if first and not last:
+                        data[i] = bytearray(piece)
+                    elif not first:
+                        data[i] += piece
+                    if not last:
+                        continue
+                    yield selected[i][0], bytes(piece) if first else bytes(data.pop(i))
+                    left -= 1
+                    # the rest of the payload is not needed
+                    if not left:
+                        return
+            except fbrb.PayloadTruncated as e:
+                raise ValueError("%s: %s" % (path, e))
+            except (EOFError, fbrb.inflater.error) as e:
+                raise ValueError("%s: payload: %s" % (path, e))
+
+    if not selected:
+        f.close()
+        return members, iter(())
+    if zipped:
+        return members, stream()
+    if size < start + payloadlen:
+        f.close()
+        raise ValueError("%s: payload is truncated" % path)
+    return members, seek()
+
+
+class PreviewCache:
+    def __init__(self, path: str, size: int = THUMBSIZE, maxbytes: int = CACHESIZE):
+        self.size = size
+        self.maxbytes = maxbytes
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # archives and members
+
+    def archive_id(self, path: str) -> int:
+        """Id of an archive whose member hashes are current; stale ones are forgotten."""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        row = self.db.execute("SELECT id, size, mtime FROM archives WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[1:] == (st.st_size, st.st_mtime_ns):
+            return row[0]
+        with self.db:
+            self.db.execute("DELETE FROM archives WHERE path = ?", (path,))
+            return self.db.execute("INSERT INTO archives(path, size, mtime) VALUES (?, ?, ?)",
+                                   (path, st.st_size, st.st_mtime_ns)).lastrowid
+
+    def known(self, archive: int) -> dict:
+        """{member: hash} of an archive for members whose preview is still cached."""
+        return dict(self.db.execute("SELECT m.path, m.hash FROM members m JOIN previews p ON p.hash = m.hash "
+                                    "WHERE m.archive = ?", (archive,)))
+
+    def has(self, digest: bytes) -> bool:
+        return self.db.execute("SELECT 1 FROM previews WHERE hash = ?", (digest,)).fetchone() is not None
+
+    def put(self, archive: int, member: str, digest: bytes, result: tuple = None):
+        """Records member -> digest, and the render() result for digest if given."""
+        if result is not None:
+            width, height, name, png, error = result
+            self.db.execute("INSERT OR REPLACE INTO previews(hash, width, height, format, png, error, size, used) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (digest, width, height, name, png, error, len(png or b""), time.time()))
+        self.db.execute("INSERT OR REPLACE INTO members(archive, path, hash) VALUES (?, ?, ?)",
+                        (archive, member, digest))
+
+    # previews
+
+    def preview(self, digest: bytes) -> dict:
+        row = self.db.execute("SELECT width, height, format, png, error FROM previews WHERE hash = ?",
+                              (digest,)).fetchone()
+        if row is None:
+            return None
+        with self.db:
+            self.db.execute("UPDATE previews SET used = ? WHERE hash = ?", (time.time(), digest))
+        return dict(zip(("width", "height", "format", "png", "error"), row))
+
+    def get(self, archivepath: str, member: str) -> dict:
+        """
+        {width, height, format, png, error} of one member. A cached preview costs
+        one query; otherwise only this member is read from the archive.
+        Raises KeyError if the archive has no such member and ValueError if
+        the member is of a kind that has no preview.
+        """
+        if not preview_kind(member):
+            raise ValueError("%s: %s has no preview" % (archivepath, member))
+        archive = self.archive_id(archivepath)
+        row = self.db.execute("SELECT hash FROM members WHERE archive = ? AND path = ?", (archive, member)).fetchone()
+        if row is not None:
+            found = self.preview(row[0])
+            if found is not None:
+                return found
+
+        members, data = read_members(archivepath, {member})
+        for name, content in data:
+            digest = hashlib.sha1(content).digest()
+            with self.db:
+                self.put(archive, name, digest, None if self.has(digest) else
+                         render(preview_kind(name), content, self.size))
+            self.evict()
+            return self.preview(digest)
+        raise KeyError("%s: %s" % (archivepath, member))
+
+    def build(self, archivepath: str, pool=None, workers: int = WORKERS) -> dict:
+        """
+        Creates the missing previews of one archive, streaming it at most once.
+        Decoding runs on pool (a ProcessPoolExecutor with workers processes) if given.
+        Returns {members, cached, created}.
+        """
+        archive = self.archive_id(archivepath)
+        known = self.known(archive)
+        members, data = read_members(archivepath, _Wanted(known))
+        counts = dict(members=sum(1 for m in members if preview_kind(m[0])), cached=0, created=0)
+        counts["cached"] = sum(1 for m in members if m[0] in known)
+
+        pending = deque()   # (member, digest, future)
+        twins = {}          # digest on its way to a worker -> other members with the same content
+        limit = INFLIGHT * workers
+
+        def finish(member, digest, future):
+            self.put(archive, member, digest, future.result())
+            for twin in twins.pop(digest):
+                self.put(archive, twin, digest)
+            counts["created"] += 1
+
+        with self.db:
+            for name, content in data:
+                digest = hashlib.sha1(content).digest()
+                if digest in twins:
+                    twins[digest].append(name)
+                    continue
+                if self.has(digest):
+                    # same content in another member or archive
+                    self.put(archive, name, digest)
+                    counts["cached"] += 1
+                    continue
+                kind = preview_kind(name)
+                if pool is None:
+                    self.put(archive, name, digest, render(kind, content, self.size))
+                    counts["created"] += 1
+                    continue
+                twins[digest] = []
+                pending.append((name, digest, pool.submit(render, kind, content, self.size)))
+                while len(pending) >= limit:
+                    finish(*pending.popleft())
+            while pending:
+                finish(*pending.popleft())
+        self.evict()
+        return counts
+
+    def list(self, archivepath: str) -> list:
+        """(member, width, height, format, preview bytes or error) of the cached members of an archive."""
+        path = os.path.abspath(archivepath)
+        return self.db.execute("SELECT m.path, p.width, p.height, p.format, coalesce(p.error, p.size) "
+                               "FROM members m JOIN archives a ON a.id = m.archive "
+                               "JOIN previews p ON p.hash = m.hash WHERE a.path = ? ORDER BY m.path",
+                               (path,)).fetchall()
+
+    def evict(self, maxbytes: int = None) -> int:
+        """Deletes the least recently used previews until they fit maxbytes; returns how many."""
+        if maxbytes is None:
+            maxbytes = self.maxbytes
+        total = self.db.execute("SELECT coalesce(sum(size), 0) FROM previews").fetchone()[0]
+        if total <= maxbytes:
+            return 0
+        doomed = []
+        for digest, size in self.db.execute("SELECT hash, size FROM previews ORDER BY used"):
+            if total <= maxbytes:
+                break
+            doomed.append((digest,))
+            total -= size
+        with self.db:
+            self.db.executemany("DELETE FROM previews WHERE hash = ?", doomed)
+            self.db.execute("DELETE FROM members WHERE hash NOT IN (SELECT hash FROM previews)")
+        return len(doomed)
+
+
+class _Wanted:
+    """Members of an archive that can be previewed and are not cached yet."""
+
+    def __init__(self, known: dict):
+        self.known = known
+
+    def __contains__(self, member: str) -> bool:
+        return member not in self.known and bool(preview_kind(member))
+
+
+def main():
+    args = sys.argv[1:]
+    command = args[0].lower() if args else ""
+    size, maxbytes, workers = THUMBSIZE, CACHESIZE, WORKERS
+
+    opts, args = getopt(args[1:], 's:m:w:')
+    for k, v in opts:
+        if k == '-s':
+            size = int(v)
+        elif k == '-m':
+            maxbytes = int(float(v) * 1_000_000)
+        elif k == '-w':
+            workers = int(v)
+
+    if np is None and command in ("build", "get"):
+        print("numpy is required for previews")
+        sys.exit(2)
+
+    if command == "build" and len(args) >= 2:
+        archives = []
+        for source in args[1:]:
+            if os.path.isdir(source):
+                archives += [os.path.join(source, a) for a in fbrbverify.find_archives(source)]
+            else:
+                archives.append(source)
+        start = time.perf_counter()
+        created = 0
+        with PreviewCache(args[0], size, maxbytes) as cache:
+            pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+            try:
+                for archive in archives:
+                    try:
+                        counts = cache.build(archive, pool, workers)
+                    except (OSError, ValueError) as e:
+                        print("%s: %s" % (archive, e))
+                        continue
+                    created += counts["created"]
+                    if counts["members"]:
+                        print("%s: %d previews, %d created" % (archive, counts["members"], counts["created"]))
+            finally:
+                if pool is not None:
+                    pool.shutdown()
+        print("%d previews created in %.2f s" % (created, time.perf_counter() - start))
+    elif command == "get" and len(args) == 4:
+        with PreviewCache(args[0], size, maxbytes) as cache:
+            try:
+                found = cache.get(args[1], args[2])
+            except KeyError as e:
+                print("no such member: %s" % e.args[0])
+                sys.exit(1)
+            except (OSError, ValueError) as e:
+                print(e)
+                sys.exit(1)
+        if found["png"] is None:
+            print("%s: %s" % (args[2], found["error"]))
+            sys.exit(1)
+        tmp = args[3] + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(found["png"])
+        os.replace(tmp, args[3])
+        print("%s %dx%d" % (found["format"], found["width"], found["height"]))
+    elif command == "list" and len(args) == 2:
+        with PreviewCache(args[0]) as cache:
+            for member, width, height, name, info in cache.list(args[1]):
+                print("%-9s %5dx%-5d %s  %s" % (name or "-", width, height, member, info))
+    elif command == "evict" and len(args) == 1:
+        with PreviewCache(args[0], maxbytes=maxbytes) as cache:
+            print("%d previews evicted" % cache.evict())
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
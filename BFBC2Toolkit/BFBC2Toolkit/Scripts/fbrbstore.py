@@ -0,0 +1,249 @@
+###############################
+#   Created for BFBC2 Toolkit
+#   Uses fbrb.py and fbrbverify.py from this folder
+###############################
+
+"""
+Usage:
+    python fbrbstore.py add profile.db game_folder|archive.fbrb ...
+    python fbrbstore.py list profile.db [archive] [extension]
+    python fbrbstore.py export profile.db archive target_folder
+    python fbrbstore.py pack profile.db archive targetfile
+    python fbrbstore.py gc profile.db
+
+Single-file store for extracted game profiles. Instead of writing every member
+of every bundle into folders, members go into one SQLite database: contents
+are stored once per SHA-1 in 'blobs', and 'members' indexes them by archive,
+path, extension and size. Member paths are the ones unpacker() would write,
+so export() gives the same folder as extracting the archive, and packer() in
+fbrb.py can pack an archive straight from the store.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import sys
+import zlib
+from struct import unpack_from
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fbrb  # noqa: E402
+import fbrbverify  # noqa: E402
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash BLOB PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archives (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    zipped INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS members (
+    id INTEGER PRIMARY KEY,
+    archive INTEGER NOT NULL REFERENCES archives(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    extension TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    hash BLOB NOT NULL REFERENCES blobs(hash)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS members_archive_path ON members(archive, path);
+CREATE INDEX IF NOT EXISTS members_extension ON members(extension);
+CREATE INDEX IF NOT EXISTS members_size ON members(size);
+CREATE INDEX IF NOT EXISTS members_hash ON members(hash);
+"""
+
+
+def read_members(path: str):
+    """
+    Streams the payload of an archive once. The first item is ('zipped', flag),
+    then (position in TOC, member path, data) for every member.
+    Raises ValueError if the archive is broken.
+    """
+    errors = []
+    size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        if size < 8 or f.read(4) != b"FbRB":
+            raise ValueError("%s: not an FbRB archive" % path)
+        cut = unpack_from(">I", f.read(4))[0]
+        if cut + 8 > size:
+            raise ValueError("%s: part1 size %d exceeds the file" % (path, cut))
+        try:
+            part1 = zlib.decompress(f.read(cut), 31)
+        except zlib.error as e:
+            raise ValueError("%s: part1: %s" % (path, e))
+
+        members, zipped, payloadlen = fbrb.read_toc(part1, errors)
+        if errors:
+            raise ValueError("%s: %s" % (path, "; ".join(errors)))
+        yield "zipped", zipped
+
+        data = {}   # index: bytes so far of a member that continues in the next chunk
+        try:
+            for i, piece, first, last in fbrb.memberslices(fbrb.payloadchunks(f, zipped), [m[1:] for m in members]):
+                if first and last:
+                    yield i, members[i][0], bytes(piece)
+                elif first:
+                    data[i] = bytearray(piece)
+                else:
+                    data[i] += piece
+                    if last:
+                        yield i, members[i][0], bytes(data.pop(i))
+        except fbrb.PayloadTruncated as e:
+            raise ValueError("%s: %s" % (path, e))
+        except (EOFError, fbrb.inflater.error) as e:
+            raise ValueError("%s: payload: %s" % (path, e))
+
+
+class ProfileStore:
+    def __init__(self, path: str):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("PRAGMA foreign_keys=ON")
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # writing
+
+    def add_archive(self, fbrbpath: str, name: str) -> int:
+        """Imports one .fbrb under name (replacing an older import); returns the number of members."""
+        count = 0
+        with self.db:
+            self.db.execute("DELETE FROM archives WHERE name = ?", (name,))
+            members = read_members(fbrbpath)
+            zipped = next(members)[1]
+            archive = self.db.execute("INSERT INTO archives(name, zipped) VALUES (?, ?)", (name, int(zipped))).lastrowid
+            for position, path, data in members:
+                digest = hashlib.sha1(data).digest()
+                self.db.execute("INSERT OR IGNORE INTO blobs(hash, size, data) VALUES (?, ?, ?)",
+                                (digest, len(data), data))
+                self.db.execute("INSERT INTO members(archive, position, path, extension, size, hash) "
+                                "VALUES (?, ?, ?, ?, ?, ?)",
+                                (archive, position, path, os.path.splitext(path)[1][1:].lower(), len(data), digest))
+                count += 1
+        return count
+
+    def add_folder(self, folder: str) -> dict:
+        """Imports every .fbrb below folder, named by its relative path; returns {name: members or error}."""
+        results = {}
+        for name in fbrbverify.find_archives(folder):
+            try:
+                results[name] = self.add_archive(os.path.join(folder, name), name)
+            except (OSError, ValueError) as e:
+                results[name] = str(e)
+        return results
+
+    def gc(self) -> int:
+        """Deletes blobs no member refers to any more; returns how many."""
+        with self.db:
+            count = self.db.execute("DELETE FROM blobs WHERE hash NOT IN (SELECT hash FROM members)").rowcount
+        self.db.execute("VACUUM")
+        return count
+
+    # reading
+
+    def archives(self) -> list:
+        return [row[0] for row in self.db.execute("SELECT name FROM archives ORDER BY name")]
+
+    def members(self, archive: str = None, extension: str = None, prefix: str = None) -> list:
+        """(archive, path, extension, size) of matching members, in TOC order per archive."""
+        query = ("SELECT a.name, m.path, m.extension, m.size FROM members m JOIN archives a ON a.id = m.archive "
+                 "WHERE 1")
+        args = []
+        if archive is not None:
+            query += " AND a.name = ?"
+            args.append(archive)
+        if extension is not None:
+            query += " AND m.extension = ?"
+            args.append(extension.lower())
+        if prefix is not None:
+            query += " AND m.path >= ? AND m.path < ?"
+            args += [prefix, prefix + "\U0010ffff"]
+        query += " ORDER BY a.name, m.position"
+        return self.db.execute(query, args).fetchall()
+
+    def read(self, archive: str, path: str) -> bytes:
+        row = self.db.execute("SELECT b.data FROM members m JOIN archives a ON a.id = m.archive "
+                              "JOIN blobs b ON b.hash = m.hash WHERE a.name = ? AND m.path = ?",
+                              (archive, path)).fetchone()
+        if row is None:
+            raise KeyError("%s: %s" % (archive, path))
+        return row[0]
+
+    def read_id(self, member: int) -> bytes:
+        return self.db.execute("SELECT b.data FROM members m JOIN blobs b ON b.hash = m.hash WHERE m.id = ?",
+                               (member,)).fetchone()[0]
+
+    def scan(self, archive: str) -> list:
+        """(member id, path, size) of one archive in TOC order, as used by packer()."""
+        return self.db.execute("SELECT m.id, m.path, m.size FROM members m JOIN archives a ON a.id = m.archive "
+                               "WHERE a.name = ? ORDER BY m.position", (archive,)).fetchall()
+
+    def export(self, archive: str, targetfolder: str) -> int:
+        """Writes the members of an archive into targetfolder like unpacker() would; returns the count."""
+        count = 0
+        for member, path, size in self.scan(archive):
+            outpath = os.path.join(targetfolder, *path.split("/"))
+            os.makedirs(os.path.dirname(outpath), exist_ok=True)
+            with open(outpath, "wb") as out:
+                out.write(self.read_id(member))
+            count += 1
+        return count
+
+
+def main():
+    args = sys.argv[1:]
+    command = args[0].lower() if args else ""
+
+    if command == "add" and len(args) >= 3:
+        with ProfileStore(args[1]) as store:
+            for source in args[2:]:
+                if os.path.isdir(source):
+                    results = store.add_folder(source)
+                else:
+                    name = os.path.basename(source)
+                    try:
+                        results = {name: store.add_archive(source, name)}
+                    except (OSError, ValueError) as e:
+                        results = {name: str(e)}
+                for name, result in results.items():
+                    print("%s: %s" % (name, result if isinstance(result, str) else "%d members" % result))
+    elif command == "list" and len(args) in (2, 3, 4):
+        with ProfileStore(args[1]) as store:
+            if len(args) == 2:
+                for name in store.archives():
+                    print(name)
+            else:
+                for archive, path, extension, size in store.members(args[2], args[3] if len(args) == 4 else None):
+                    print("%10d  %s" % (size, path))
+    elif command == "export" and len(args) == 4:
+        with ProfileStore(args[1]) as store:
+            print("%d files written" % store.export(args[2], args[3]))
+    elif command == "pack" and len(args) == 4:
+        with ProfileStore(args[1]) as store:
+            fbrb.packer(args[2], args[3], store=store)
+    elif command == "gc" and len(args) == 2:
+        with ProfileStore(args[1]) as store:
+            print("%d unused blobs deleted" % store.gc())
+    else:
+        print(__doc__)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+###############################
+#   Created for BFBC2 Toolkit
+#   Uses fbrb.py from this folder
+###############################
+
+"""
+Usage:
+    python fbrbverify.py -g golden.json [-w workers] game_folder
+    python fbrbverify.py -m golden.json [-o report.json] [-a] [-w workers] game_folder
+
+Checks every .fbrb archive below game_folder without extracting anything:
+the gzip CRC and length of the TOC (part1) and of the payload, the TOC offsets
+and sizes, and a SHA-1 of every member. With -g the member hashes of a known
+good install are written as the golden manifest; with -m they are compared
+against it and a report per archive and member is written (members that match
+are only counted unless -a is given).
+
+Archives are verified on a process pool. Each worker streams its archive in
+fbrb.BUFFSIZE chunks, so memory per worker is bounded by the chunk size and the TOC.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sys
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from getopt import getopt
+from struct import unpack_from
+
+# embedded python does not put the script folder on sys.path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fbrb  # noqa: E402
+
+WORKERS = os.cpu_count() or 1
+
+
+def hash_members(chunks, members: list, errors: list) -> tuple:
+    """Feeds the payload stream into one hasher per member; returns ({name: sha1}, payload size)."""
+    hashes = {}
+    hashers = {}
+    done = set()
+    size = 0
+
+    def counted():
+        nonlocal size
+        for chunk in chunks:
+            size += len(chunk)
+            yield chunk
+
+    try:
+        for i, piece, first, last in fbrb.memberslices(counted(), [m[1:] for m in members]):
+            if first:
+                hashers[i] = hashlib.sha1()
+            hashers[i].update(piece)
+            if last:
+                hashes[members[i][0]] = hashers.pop(i).hexdigest()
+                done.add(i)
+    except fbrb.PayloadTruncated:
+        pass
+    except (EOFError, fbrb.inflater.error) as e:
+        errors.append("payload: %s" % e)
+
+    # members the stream never finished
+    for i, (name, offset, length) in enumerate(members):
+        if i not in done:
+            errors.append("%s: payload ends at %d before the member does (%d)" % (name, size, offset + length))
+
+    return hashes, size
+
+
+def verify_archive(path: str) -> dict:
+    """Verifies one archive; returns {size, errors, members: {name: sha1}}."""
+    errors = []
+    result = dict(size=0, errors=errors, members={})
+    try:
+        size = os.path.getsize(path)
+        result["size"] = size
+        with open(path, "rb") as f:
+            if size < 8 or f.read(4) != b"FbRB":
+                errors.append("not an FbRB archive")
+                return result
+            cut = unpack_from(">I", f.read(4))[0]
+            if cut + 8 > size:
+                errors.append("part1 size %d exceeds the file" % cut)
+                return result
+            try:
+                part1 = zlib.decompress(f.read(cut), 31)
+            except zlib.error as e:
+                errors.append("part1: %s" % e)
+                return result
+
+            members, zipped, payloadlen = fbrb.read_toc(part1, errors)
+            hashes, actual = hash_members(fbrb.payloadchunks(f, zipped), members, errors)
+            if actual != payloadlen:
+                errors.append("payload is %d bytes, TOC says %d" % (actual, payloadlen))
+            if len(hashes) != len(members):
+                names = [m[0] for m in members]
+                if len(set(names)) != len(names):
+                    errors.append("TOC lists the same member more than once")
+            result["members"] = hashes
+    except (OSError, ValueError) as e:
+        errors.append(str(e))
+    return result
+
+
+def find_archives(folder: str) -> list:
+    """Relative paths (with /) of all .fbrb files below folder, sorted."""
+    found = []
+    for dir0, dirs, files in os.walk(folder):
+        for fname in files:
+            if fname.lower().endswith(".fbrb"):
+                found.append(os.path.relpath(os.path.join(dir0, fname), folder).replace(os.sep, "/"))
+    found.sort()
+    return found
+
+
+def verify_folder(folder: str, workers: int = WORKERS) -> dict:
+    """{relative archive path: verify_archive() result} for every archive below folder."""
+    archives = find_archives(folder)
+    paths = [os.path.join(folder, a) for a in archives]
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(verify_archive, paths, chunksize=1))
+    else:
+        results = [verify_archive(p) for p in paths]
+    return dict(zip(archives, results))
+
+
+def compare(results: dict, golden: dict, listall: bool = False) -> dict:
+    """Builds the report of results against a golden manifest."""
+    report = dict(ok=0, corrupt=0, modified=0, missing=0, extra=0, archives={})
+
+    for archive in sorted(set(results) | set(golden)):
+        if archive not in results:
+            report["missing"] += 1
+            report["archives"][archive] = dict(status="missing")
+            continue
+
+        result = results[archive]
+        expected = golden.get(archive)
+        if expected is None:
+            status = "corrupt" if result["errors"] else "extra"
+            report[status] += 1
+            report["archives"][archive] = dict(status=status, errors=result["errors"])
+            continue
+
+        counts = dict(ok=0, modified=0, missing=0, extra=0)
+        members = {}
+        actual = result["members"]
+        for name in sorted(set(actual) | set(expected)):
+            if name not in actual:
+                state = "missing"
+            elif name not in expected:
+                state = "extra"
+            elif actual[name] == expected[name]:
+                state = "ok"
+            else:
+                state = "modified"
+            counts[state] += 1
+            if state != "ok" or listall:
+                members[name] = state
+
+        if result["errors"]:
+            status = "corrupt"
+        elif counts["modified"] or counts["missing"] or counts["extra"]:
+            status = "modified"
+        else:
+            status = "ok"
+        report[status] += 1
+        report["archives"][archive] = dict(status=status, errors=result["errors"], counts=counts, members=members)
+
+    return report
+
+
+def write_json(path: str, document):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(document, f, indent=1)
+    os.replace(tmp, path)
+
+
+def main():
+    goldenout = goldenin = outputfile = ""
+    workers = WORKERS
+    listall = False
+
+    opts, args = getopt(sys.argv[1:], 'g:m:o:w:a')
+    for k, v in opts:
+        if k == '-g':
+            goldenout = v
+        elif k == '-m':
+            goldenin = v
+        elif k == '-o':
+            outputfile = v
+        elif k == '-w':
+            workers = int(v)
+        elif k == '-a':
+            listall = True
+
+    if len(args) != 1 or not (goldenout or goldenin):
+        print("usage: python fbrbverify.py -g golden.json | -m golden.json [-o report.json] [-a] [-w workers] game_folder")
+        sys.exit(2)
+
+    results = verify_folder(args[0], workers)
+
+    if goldenout:
+        broken = {a: r["errors"] for a, r in results.items() if r["errors"]}
+        for archive, errors in broken.items():
+            print("%s: %s" % (archive, "; ".join(errors)))
+        write_json(goldenout, {a: r["members"] for a, r in results.items() if not r["errors"]})
+        print("%d archives hashed, %d skipped because of errors" % (len(results) - len(broken), len(broken)))
+        return
+
+    with open(goldenin, "r", encoding="utf-8") as f:
+        golden = json.load(f)
+    report = compare(results, golden, listall)
+
+    for archive, entry in report["archives"].items():
+        if entry["status"] != "ok":
+            print("%s: %s %s" % (archive, entry["status"], "; ".join(entry.get("errors", []))))
+    print("%d ok, %d modified, %d corrupt, %d missing, %d extra"
+          % (report["ok"], report["modified"], report["corrupt"], report["missing"], report["extra"]))
+
+    if outputfile:
+        write_json(outputfile, report)
+    if report["corrupt"] or report["modified"] or report["missing"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
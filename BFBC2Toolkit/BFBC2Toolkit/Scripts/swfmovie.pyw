@@ -14,7 +14,7 @@
 #
 # this script is written for microsoft windows. it can probably be easily
 # adapted for other platforms, but i haven't tried.
-# 
+#
 # file structure:
 # the file consists of a global header, an index of all the embedded
 # files, and the actual file data.
@@ -37,114 +37,212 @@
 # file data:
 # raw file data at the positions specified in the index
 
-import struct
-import sys
+"""
+Usage:
+    pythonw swfmovie.pyw file.swfmovie target_folder
+    pythonw swfmovie.pyw folder_with_swfmovies target_folder
+    python swfmovie.pyw list file.swfmovie|folder_with_swfmovies
+
+A folder is searched recursively for .swfmovie files; each one is extracted
+into a sub folder of the target that mirrors its relative path.
+"""
+
+import mmap
 import os
-import os.path
-
-# Define an empty class to emulate a c struct
-# that can hold the data for each entry in the
-# file index.
-class entry:
-	pass
-
-if len(sys.argv) != 3:
-	print("usage: python bigdecoder.py [file] [target]")
-	exit()
-	
-print("BIG-file decoder by aderyn@gmail.com")
-
-filePath = sys.argv[1]
-targetDir = sys.argv[2]
-
-if not os.path.exists(filePath):
-	print("Requested file doesn't exist.")
-	exit()
-	
-if targetDir[-1] != "\\":
-	targetDir += "\\"
-	
-print("Processing " + filePath)
-
-# open the file in binary read mode.
-# without the b-flag the tell-method
-# returns the wrong value.
-file = open(filePath, "rb")
-
-# read global header:
-
-# this seems to vary. zero hour uses BIGF
-header = file.read(4)
-if header != "BIGF":
-	print("Invalid file format.")
-	exit()
-
-# this seems to be the only value encoded in
-# little-endian order.
-(size,) = struct.unpack("<I", file.read(4))
-print("size: %d" % size)
-
-(entryCount,indexSize) = struct.unpack(">II", file.read(8))
-print("entry count: %d" % entryCount)
-print("index size: %d" % indexSize)
-
-# read the index table:
-
-# assume that the file contains the amount of 
-# entries specified by the global header
-entries = []
-for j in range(0, entryCount):
-
-	(entryPos,entrySize) = struct.unpack(">II", file.read(8))
-	
-	# the filename is stored as a cstring and
-	# ends with a null byte. read until we reach
-	# this byte.
-	fileName = ""
-	while True:
-		n = file.read(1)
-		if ord(n) == 0:
-			break
-		
-		fileName += n
-	
-	e = entry()
-	e.name = fileName
-	e.position = entryPos
-	e.size = entrySize
-	
-	entries.append(e)
-
-# iterate through the index entries and copy the data into separate files.
-for i, e in enumerate(entries):
-    print("opening %s (size: %d, position: %d)" % (e.name, e.size, e.position))
-    print("file %d of %d" % (i + 1, entryCount))
-
-    # calculate the path where the file will be created
-    fileTargetDir = os.path.join(targetDir, e.name[:e.name.rfind("\\")])
-    fileName = e.name[e.name.rfind("\\") + 1:]
-    targetPath = os.path.join(fileTargetDir, fileName)
-
-    # create the directories if they don't exist.
-    if not os.path.exists(fileTargetDir):
-        os.makedirs(fileTargetDir)
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from struct import unpack_from
+from typing import NamedTuple
+
+HEADERS = (b"BIGF", b"BIG4")   # zero hour uses BIGF
+WORKERS = min(8, (os.cpu_count() or 1) + 4)
+BUFFSIZE = 1_000_000           # 1 MB per write when copying a member
+
+
+class Entry(NamedTuple):
+    name: str
+    position: int
+    size: int
+
+
+def read_index(data) -> list:
+    """
+    Parses the global header and the whole index table from a bytes-like object
+    (usually an mmap of the file) and returns a list of Entry.
+    Raises ValueError if the data is not a BIG file.
+    """
+    if len(data) < 16 or bytes(data[0:4]) not in HEADERS:
+        raise ValueError("Invalid file format.")
+
+    # the total size is the only value encoded in little-endian order.
+    (entry_count, _index_size) = unpack_from(">II", data, 8)
+
+    entries = []
+    offset = 16
+    for _ in range(entry_count):
+        if offset + 8 > len(data):
+            raise ValueError("Index table is truncated.")
+        (position, size) = unpack_from(">II", data, offset)
+        offset += 8
+
+        end = data.find(b"\x00", offset)
+        if end == -1:
+            raise ValueError("Index table is truncated.")
+        name = bytes(data[offset:end]).decode("utf-8", errors="replace")
+        offset = end + 1
+
+        entries.append(Entry(name, position, size))
+
+    return entries
+
+
+def target_path(target_dir: str, name: str) -> str:
+    """Maps a member name (backslash separated) below target_dir, refusing paths that escape it."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".")]
+    if not parts or ".." in parts:
+        return ""
+    return os.path.join(target_dir, *parts)
+
+
+def copy_member(view: memoryview, e: Entry, target_dir: str) -> int:
+    """Writes one member straight from the mapped file; returns the number of bytes written."""
+    path = target_path(target_dir, e.name)
+    if not path:
+        print("%s has an invalid name. Skipping." % e.name)
+        return 0
+
+    if e.position + e.size > len(view):
+        print("%s points outside of the file. Skipping." % e.name)
+        return 0
 
     # skip files that already exist.
-    if os.path.exists(targetPath):
-        print("%s exists. Skipping." % targetPath)
-        continue
+    if os.path.exists(path):
+        print("%s exists. Skipping." % path)
+        return 0
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
 
-    print("Opening %s for writing" % targetPath)
-    with open(targetPath, "wb") as targetFile:
-        print("Seeked to %d" % e.position)
-        file.seek(e.position)
+    with open(path, "wb") as out:
+        for start in range(e.position, e.position + e.size, BUFFSIZE):
+            out.write(view[start:min(start + BUFFSIZE, e.position + e.size)])
+
+    return e.size
 
-        print("Starting data transfer")
-        for _ in range(e.size):
-            byte = file.read(1)
-            targetFile.write(byte)
 
-        print("Wrote %d bytes" % e.size)
+def extract(file_path: str, target_dir: str, workers: int = WORKERS) -> tuple:
+    """
+    Extracts all members of one BIG file into target_dir.
+    Returns (number of files written, number of bytes written).
+    """
+    print("Processing " + file_path)
+
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            print("Invalid file format.")
+            return 0, 0
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                entries = read_index(mm)
+            except ValueError as e:
+                print(e)
+                return 0, 0
+
+            print("entry count: %d" % len(entries))
+
+            view = memoryview(mm)
+            try:
+                if workers > 1 and len(entries) > 1:
+                    with ThreadPoolExecutor(max_workers=workers) as pool:
+                        written = list(pool.map(lambda e: copy_member(view, e, target_dir), entries))
+                else:
+                    written = [copy_member(view, e, target_dir) for e in entries]
+            finally:
+                view.release()
+
+    return sum(1 for w in written if w), sum(written)
+
+
+def list_entries(file_path: str) -> list:
+    """Prints and returns the index of one BIG file without extracting anything."""
+    with open(file_path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            print("%s: invalid file format." % file_path)
+            return []
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            try:
+                entries = read_index(mm)
+            except ValueError as e:
+                print("%s: %s" % (file_path, e))
+                return []
+
+    print("%s (%d files)" % (file_path, len(entries)))
+    for e in entries:
+        print("%10d %10d  %s" % (e.position, e.size, e.name))
+
+    return entries
+
+
+def find_swfmovies(folder: str) -> list:
+    """Returns all .swfmovie files below folder, sorted by path."""
+    found = []
+    for dir0, dirs, files in os.walk(folder):
+        for fname in files:
+            if fname.lower().endswith(".swfmovie"):
+                found.append(os.path.join(dir0, fname))
+    found.sort()
+    return found
+
+
+def report(label: str, files: int, size: int, seconds: float):
+    mb = size / 1_000_000
+    rate = mb / seconds if seconds > 0 else 0.0
+    print("%s: %d files, %.2f MB in %.2f s (%.2f MB/s)" % (label, files, mb, seconds, rate))
+
+
+def main():
+    args = sys.argv[1:]
+
+    if len(args) == 2 and args[0].lower() == "list":
+        source = args[1]
+        for path in (find_swfmovies(source) if os.path.isdir(source) else [source]):
+            list_entries(path)
+        return
+
+    if len(args) != 2:
+        print("usage: python swfmovie.pyw [file|folder] [target]")
+        print("       python swfmovie.pyw list [file|folder]")
+        return
+
+    print("BIG-file decoder by aderyn@gmail.com")
+
+    source, target = args
 
-    print("Done, closing file.\n")
-	
+    if not os.path.exists(source):
+        print("Requested file doesn't exist.")
+        return
+
+    if not os.path.isdir(source):
+        start = time.perf_counter()
+        files, size = extract(source, target)
+        report(source, files, size, time.perf_counter() - start)
+        return
+
+    # batch mode: every .swfmovie of an extracted game folder
+    total_files = total_size = 0
+    start = time.perf_counter()
+    for path in find_swfmovies(source):
+        relative = os.path.splitext(os.path.relpath(path, source))[0]
+        t0 = time.perf_counter()
+        files, size = extract(path, os.path.join(target, relative))
+        report(relative, files, size, time.perf_counter() - t0)
+        total_files += files
+        total_size += size
+
+    report("Total", total_files, total_size, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()